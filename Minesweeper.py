@@ -1,177 +1,351 @@
 # -*- coding: utf8 -*-
-from random import randint
-import xlsxwriter
 from PyQt5 import uic
-from PyQt5.QtWidgets import QApplication, QMainWindow, QPushButton, QTableWidgetItem
+from PyQt5.QtWidgets import QApplication, QMainWindow, QPushButton, QAbstractScrollArea, QHeaderView, QTableWidgetItem, QLabel
 import sys
-from PyQt5.QtGui import QIcon
-from PyQt5.QtCore import QSize, Qt, QTimer
+import os
+import argparse
 import sqlite3
+from PyQt5.QtGui import QIcon, QPixmap, QPainter, QPen, QColor
+from PyQt5.QtCore import QSize, Qt, QTimer, QRect, QAbstractTableModel, QModelIndex, QThread, pyqtSignal
+from pole import Pole, LEVELS, BOMB, OPEN, FLAG, QUESTION
+from solver import Solver
+from database import connect, add_player, games_cursor, count_games, leaderboard, ResultWriter, RESULT_NAMES, CUSTOM_LEVEL, level_name
+from replay import Replay, OPEN_MOVE, MARK_MOVE, replays_dir
+from timings import Timings, ENVIRONMENT_VARIABLE
 
 
-LEVELS = [("Easy", 8, 10), ("Medium", 16, 40), ("Hard", 24, 99)]
-INFOS = ("Flag", "Bomb", "Open", "Close", "Question")
+# Icons of opened cells by amount of bombs near them
+NUMBER_ICONS = ("0.jpg", "1.jpg", "2.jpg", "3.jpg", "4.jpg", "5.jpg", "6.jpg", "6.jpg", "6.jpg")
+ICON_FILES = NUMBER_ICONS[:7] + ("cell.jpg", "flag.jpg", "question.jpg", "bomb.jpg", "bomb1.jpg", "bomb2.jpg")
+# Custom level is drawn by BoardView, its side in pixels is limited by BOARD_SIDE
+BOARD_SIDE = 750
+CELL_SIZE = 25
+MIN_CELL_SIZE = 4
+MAX_CELL_SIZE = 64
+# Rows of statistics table loaded from database at once
+PAGE_SIZE = 200
+# Database of players and games, replays are kept next to it
+DB_PATH = 'games.db'
+# Directory of images and .ui files: directory of program or of unpacked PyInstaller build
+RESOURCES_DIR = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
 
 
-class Cell:
-    def __init__(self, info):
-        self.info = info
-        self.bombs_near = -1
-    
-    def add_to_info(self, str1):
-        '''Adds str1 to info about this cell'''
-        self.info.append(str1)
-        self.info = list(set(self.info))
-    
-    def is_bombed(self):
-        '''Returns bool value: True if there is a bomb in this cell else: False'''
-        return "Bomb" in self.info
-    
-    def set_bombs_near(self, n):
-        '''Sets amount of bombs near this cell'''
-        self.bombs_near = n
-    
-    def get_bombs_near(self):
-        '''Returns amount of bombs near this cell'''
-        return self.bombs_near
-    
-    def get_info(self):
-        '''Returns tuple of information about this cell'''
-        return self.info
-    
-    def set_info(self, info):
-        '''Sets tuple of information about this cell'''
-        self.info = info
+# Images decoded once and shared by all buttons and boards
+PIXMAPS = {}
+ICONS = {}
+# Classes compiled from .ui files, so that every screen does not parse XML again
+UI_FORMS = {}
 
 
-class Pole:
-    def __init__(self, level):
-        self.level_name = level[0]
-        self.size = level[1]
-        self.bombs_amount = level[2]
-        self.pole = []
-        self.generate_pole()
+def load_ui(name, window):
+    '''Creates widgets of .ui file name in window, compiling file only on first call'''
+    if name not in UI_FORMS:
+        UI_FORMS[name] = uic.loadUiType(os.path.join(RESOURCES_DIR, name))[0]
+    form = UI_FORMS[name]()
+    form.setupUi(window)
+    # Widgets are attributes of window, as with uic.loadUi
+    for attribute, value in vars(form).items():
+        setattr(window, attribute, value)
+
+
+def get_pixmap(name, size=None):
+    '''Returns pixmap from image file name scaled to size x size, decoding file only on first call'''
+    if (name, size) not in PIXMAPS:
+        if size is None:
+            PIXMAPS[(name, size)] = QPixmap(os.path.join(RESOURCES_DIR, name))
+        else:
+            PIXMAPS[(name, size)] = get_pixmap(name).scaled(size, size, Qt.IgnoreAspectRatio,
+                                                            Qt.SmoothTransformation)
+    return PIXMAPS[(name, size)]
+
+
+def get_icon(name):
+    '''Returns icon from image file name, decoding file only on first call'''
+    if name not in ICONS:
+        ICONS[name] = QIcon(get_pixmap(name))
+    return ICONS[name]
+
+
+def preload_icons():
+    '''Decodes all images of cells, so that the first game does not wait for them'''
+    for name in ICON_FILES:
+        get_icon(name)
+
+
+def cell_icon_name(pole, x, y):
+    '''Returns image file name for cell(x, y) of pole during game'''
+    state = pole.state[pole.index(x, y)]
+    if state & OPEN:
+        return NUMBER_ICONS[pole.bombs_near[pole.index(x, y)]]
+    if state & FLAG:
+        return "flag.jpg"
+    if state & QUESTION:
+        return "question.jpg"
+    return "cell.jpg"
+
+
+class PushButtonRight(QPushButton):
+    def __init__(self, text, game, x, y):
+        super().__init__(text, game)
+        self.args = (text, game)
+        # Coordinates of cell of this button in pole
+        self.cell = (x, y)
+
+    def mousePressEvent(self, event):
+        game = self.args[1]
+        with game.timings.measure("lookup"):
+            x, y = self.cell
+            button = {Qt.LeftButton: "l", Qt.RightButton: "r"}.get(event.button())
+        if button is not None:
+            game.game_click(x, y, button)
+
+
+class BoardView(QAbstractScrollArea):
+    '''Board of custom level: draws only visible cells of pole, supports scrolling
+    and zooming with Ctrl + mouse wheel'''
+    def __init__(self, parent, game):
+        super().__init__(parent)
+        self.game = game
+        self.pole = game.pole
+        self.cell_size = CELL_SIZE
+        self.won = False
+        self.lost = None
+        # Cell (x, y) and color of frame of hint
+        self.hint = None
+        self.update_scroll()
     
-    def generate_pole(self):
-        '''Generates pole with bombs'''
-        self.pole = []
-        for i in range(self.size):
-            self.pole.append([])
-            for j in range(self.size):
-                self.pole[-1].append(Cell(["Close"]))
-        for i in range(self.bombs_amount):
-            x = randint(0, self.size - 1)
-            y = randint(0, self.size - 1)
-            while self.pole[x][y].is_bombed():
-                x = randint(0, self.size - 1)
-                y = randint(0, self.size - 1)
-            self.pole[x][y].add_to_info("Bomb")
-        self.set_bombs_near()
-    
-    def set_bombs_near(self):
-        '''Sets amount of bombs near all cells of pole'''
-        for i in range(self.size):
-            for j in range(self.size):
-                bombs_amount = 0
-                for k in range(-1, 2):
-                    for m in range(-1, 2):
-                        if (k == 0) and (m == 0):
-                            continue
-                        x = i + k
-                        y = j + m
-                        if (x < 0) or (y < 0) or (x >= self.size) or (y >= self.size):
-                            continue
-                        if self.pole[x][y].is_bombed():
-                            bombs_amount += 1
-                self.pole[i][j].set_bombs_near(bombs_amount)
-    
-    def move(self, x, y):
-        '''Imitates game move in cell(x, y)
-        Returns None if cell is not in pole, False if player is lost, else True'''
-        if (x < 0) or (y < 0) or (x >= self.size) or (y >= self.size):
-            return None
-        if self.pole[x][y].is_bombed():
-            return False
-        self.open_cells(x, y)
-        return True
-        
-    def open_cells(self, x, y):
-        '''Opens all cells for player near cell(x, y) if cell(x, y) has no bombs near itself'''
-        info = self.pole[x][y].get_info()
-        if "Close" in info:
-            del info[info.index("Close")]
-        info = []
-        self.pole[x][y].set_info(info)
-        self.pole[x][y].add_to_info("Open")
-        if self.pole[x][y].get_bombs_near() == 0:
-            for i in range(-1, 2):
-                for j in range(-1, 2):
-                    if (i == 0) and (j == 0):
-                        continue
-                    x1 = i + x
-                    y1 = j + y
-                    if (x1 < 0) or (y1 < 0) or (x1 >= self.size) or (y1 >= self.size):
-                        continue
-                    if "Close" in self.pole[x1][y1].get_info():
-                        self.open_cells(x1, y1)
-    
-    def get_pole(self):
-        '''Returns tuple of tuple : game pole'''
-        return self.pole
-    
-    def get_info_cell(self, x, y):
-        '''Returns None if cell(x, y) not in pole, else returns info about cell(x, y)'''
-        if (x < 0) or (y < 0) or (x >= self.size) or (y >= self.size):
-            return None
-        return self.pole[x][y].get_info()
+    def update_scroll(self):
+        '''Sets ranges of scroll bars for current size of cells'''
+        full = self.pole.size * self.cell_size
+        viewport = self.viewport().size()
+        for bar, side in ((self.horizontalScrollBar(), viewport.width()),
+                          (self.verticalScrollBar(), viewport.height())):
+            bar.setRange(0, max(full - side, 0))
+            bar.setPageStep(side)
+            bar.setSingleStep(self.cell_size)
+    
+    def cell_at(self, pos):
+        '''Returns cell (x, y) under point pos of viewport'''
+        return ((pos.x() + self.horizontalScrollBar().value()) // self.cell_size,
+                (pos.y() + self.verticalScrollBar().value()) // self.cell_size)
+    
+    def icon_name(self, x, y):
+        '''Returns image file name for cell(x, y), including end of game'''
+        bombed = self.pole.state[self.pole.index(x, y)] & BOMB
+        if self.won:
+            return "bomb2.jpg" if bombed else "0.jpg"
+        if self.lost == (x, y):
+            return "bomb1.jpg"
+        if (self.lost is not None) and bombed:
+            return "bomb.jpg"
+        return cell_icon_name(self.pole, x, y)
+    
+    def update_cells(self, cells):
+        '''Repaints rectangle of viewport containing changed cells (x, y)'''
+        if not cells:
+            return
+        c = self.cell_size
+        xs = [cell[0] for cell in cells]
+        ys = [cell[1] for cell in cells]
+        left = min(xs) * c - self.horizontalScrollBar().value()
+        top = min(ys) * c - self.verticalScrollBar().value()
+        self.viewport().update(QRect(left, top, (max(xs) - min(xs) + 1) * c, (max(ys) - min(ys) + 1) * c))
+    
+    def show_hint(self, x, y, color):
+        '''Draws frame of color around cell(x, y) until next change of pole'''
+        self.clear_hint()
+        self.hint = (x, y, color)
+        self.update_cells([(x, y)])
+    
+    def clear_hint(self):
+        '''Removes frame of hint'''
+        if self.hint is not None:
+            cell = self.hint[:2]
+            self.hint = None
+            self.update_cells([cell])
+    
+    def show_end(self, won, x=None, y=None):
+        '''Shows end pole of game'''
+        self.won = won
+        if not won:
+            self.lost = (x, y)
+        self.viewport().update()
+    
+    def paintEvent(self, event):
+        rect = event.rect()
+        c = self.cell_size
+        dx = self.horizontalScrollBar().value()
+        dy = self.verticalScrollBar().value()
+        size = self.pole.size
+        with self.game.timings.measure("paint"):
+            painter = QPainter(self.viewport())
+            for x in range(max((rect.left() + dx) // c, 0), min((rect.right() + dx) // c + 1, size)):
+                for y in range(max((rect.top() + dy) // c, 0), min((rect.bottom() + dy) // c + 1, size)):
+                    painter.drawPixmap(x * c - dx, y * c - dy, get_pixmap(self.icon_name(x, y), c))
+            if self.hint is not None:
+                x, y, color = self.hint
+                painter.setPen(QPen(QColor(color), 2))
+                painter.drawRect(x * c - dx + 1, y * c - dy + 1, c - 2, c - 2)
+            painter.end()
     
-    def set_info_cell(self, x, y, info):
-        '''Returns None if cell(x, y) not in pole, else sets info for cell(x, y)'''
-        if (x < 0) or (y < 0) or (x >= self.size) or (y >= self.size):
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_scroll()
+    
+    def wheelEvent(self, event):
+        if not event.modifiers() & Qt.ControlModifier:
+            super().wheelEvent(event)
+            return
+        old = self.cell_size
+        if event.angleDelta().y() > 0:
+            self.cell_size = min(old * 5 // 4 + 1, MAX_CELL_SIZE)
+        else:
+            self.cell_size = max(old * 4 // 5, MIN_CELL_SIZE)
+        # Cell under mouse stays on its place
+        pos = event.pos()
+        hbar = self.horizontalScrollBar()
+        vbar = self.verticalScrollBar()
+        left = (hbar.value() + pos.x()) * self.cell_size // old - pos.x()
+        top = (vbar.value() + pos.y()) * self.cell_size // old - pos.y()
+        self.update_scroll()
+        hbar.setValue(left)
+        vbar.setValue(top)
+        self.viewport().update()
+    
+    def mousePressEvent(self, event):
+        with self.game.timings.measure("lookup"):
+            x, y = self.cell_at(event.pos())
+            inside = self.pole.in_pole(x, y)
+        if not inside:
+            return
+        if event.button() == Qt.LeftButton:
+            self.game.game_click(x, y, "l")
+        elif event.button() == Qt.RightButton:
+            self.game.game_click(x, y, "r")
+
+
+class GamesModel(QAbstractTableModel):
+    '''Table of games for statistics, rows are loaded from database by pages while
+    table is scrolled and sorted by database'''
+    def __init__(self, con, filters=()):
+        super().__init__()
+        self.con = con
+        self.filters = filters
+        self.column = None
+        self.descending = False
+        self.rows = []
+        self.cursor = None
+        self.more = False
+        self.reset()
+    
+    def reset(self):
+        '''Starts loading rows from the beginning'''
+        self.beginResetModel()
+        self.rows = []
+        self.cursor = games_cursor(self.con, self.filters, self.column, self.descending)
+        self.more = True
+        self.endResetModel()
+        self.fetchMore()
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 4
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
             return None
-        self.pole[x][y].set_info(info)
+        row = self.rows[index.row()]
+        value = row[index.column()]
+        if index.column() == 1:
+            return level_name(value, row[4], row[5])
+        if index.column() == 2:
+            return RESULT_NAMES[value]
+        return str(value)
     
-    def get_bombs_near_cell(self, x, y):
-        '''Returns None if cell(x, y) not in pole, else returns amount of bombs near cell(x, y)'''
-        if (x < 0) or (y < 0) or (x >= self.size) or (y >= self.size):
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
             return None
-        return self.pole[x][y].get_bombs_near()
-    
-    def check_win(self):
-        '''Checks win
-        Return True if player wins, else False'''
-        for i in self.pole:
-            for j in i:
-                if (not j.is_bombed()) and ('Open' not in j.get_info()):
-                    return False
-        return True
+        if orientation == Qt.Horizontal:
+            return ('Имя', 'Уровень', 'Результат', 'Время')[section]
+        return str(section + 1)
+    
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.more
+    
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        page = self.cursor.fetchmany(PAGE_SIZE)
+        if len(page) < PAGE_SIZE:
+            self.more = False
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+            self.rows.extend(page)
+            self.endInsertRows()
+    
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.column = column if column >= 0 else None
+        self.descending = order == Qt.DescendingOrder
+        self.reset()
 
 
-class PushButtonRight(QPushButton):
-    def __init__(self, *args):
-        super().__init__(*args)
-        self.args = args
+class ExportThread(QThread):
+    '''Exports games with filters to file in background, kind is key of EXPORTS
+    Emits saved with path of file or error with message if file or database can not be used'''
+    progress = pyqtSignal(int, int)
+    saved = pyqtSignal(str)
+    error = pyqtSignal(str)
 
-    def mousePressEvent(self, event):
-        if event.button() == Qt.LeftButton:
-            self.args[1].game_click(self, "l")
-        elif event.button() == Qt.RightButton:
-            self.args[1].game_click(self, "r")
+    def __init__(self, db_path, filters, path, kind):
+        super().__init__()
+        self.db_path = db_path
+        self.filters = filters
+        self.path = path
+        self.kind = kind
+
+    def run(self):
+        from export import EXPORTS
+        con = None
+        try:
+            # Connection of sqlite3 can be used only in thread which created it
+            con = connect(self.db_path)
+            total = count_games(con, self.filters)
+            self.progress.emit(0, total)
+            EXPORTS[self.kind](games_cursor(con, self.filters), self.path,
+                               lambda rows: self.progress.emit(rows, total))
+        except (OSError, sqlite3.Error) as error:
+            # Exception in QThread.run would abort whole program
+            self.error.emit(str(error))
+            return
+        finally:
+            if con is not None:
+                con.close()
+        self.saved.emit(self.path)
 
 
 class Game(QMainWindow):
-    def __init__(self):
+    def __init__(self, timings_path=None):
         super().__init__()
         self.user_name = ''
+        self.export_thread = None
+        # Durations of stages of clicks are recorded only if file for them is given
+        self.timings_path = timings_path
+        self.timings = Timings(timings_path is not None)
+        self.results = ResultWriter(DB_PATH, self.timings)
+        self.con = connect(DB_PATH)
         self.last_level = 1
+        self.custom_level = ("Custom", 100, 1500)
         self.init_start()
+        # Images are decoded after start menu is shown, while player chooses level
+        QTimer.singleShot(0, preload_icons)
     
     def init_start(self):
         '''Initialize start menu of game'''
         self.setMinimumSize(0, 0)
         self.setMaximumSize(2000, 2000)              
-        uic.loadUi('designStart.ui', self)
-        self.con = sqlite3.connect('games.db')
+        load_ui('designStart.ui', self)
         self.setMinimumSize(self.width(), self.height())
         self.setMaximumSize(self.width(), self.height())        
         self.game_now = False
@@ -179,150 +353,212 @@ class Game(QMainWindow):
         self.play.clicked.connect(self.init_game)
         self.st.clicked.connect(self.statistic)
         self.pole = None
+        self.custom_size.setValue(self.custom_level[1])
+        self.custom_bombs.setValue(self.custom_level[2])
         if self.last_level == 1:
             self.easy.setChecked(True)
         elif self.last_level == 2:
             self.medium.setChecked(True)
-        else:
+        elif self.last_level == 3:
             self.hard.setChecked(True)
+        else:
+            self.custom.setChecked(True)
     
-    def statistic(self):
-        '''Initialize start menu of statistic'''
+    def save_choice(self):
+        '''Saves name of player and level chosen in start menu'''
         self.user_name = self.line.text()
+        self.custom_level = ("Custom", self.custom_size.value(), self.custom_bombs.value())
         if self.easy.isChecked():
             self.last_level = 1
         elif self.medium.isChecked():
             self.last_level = 2
-        else:
+        elif self.hard.isChecked():
             self.last_level = 3
+        else:
+            self.last_level = CUSTOM_LEVEL
+    
+    def statistic(self):
+        '''Initialize start menu of statistic'''
+        self.save_choice()
+        self.results.flush()
         self.setMinimumSize(0, 0)
         self.setMaximumSize(2000, 2000)              
-        uic.loadUi('designStatistic.ui', self)
+        load_ui('designStatistic.ui', self)
         self.setMinimumSize(self.width(), self.height())
         self.setMaximumSize(self.width(), self.height())
         self.exit.clicked.connect(self.init_start)
-        cur = self.con.cursor()
-        self.games = cur.execute('SELECT * FROM games').fetchall()
+        self.filters = ()
         self.draw_games()
+        self.draw_leaders()
         self.filter.clicked.connect(self.filtrate)
         self.to_excel.clicked.connect(self.convert_to_excel)
+        self.to_csv.clicked.connect(self.convert_to_csv)
     
     def convert_to_excel(self):
         '''Make Excel file from games'''
-        wb = xlsxwriter.Workbook('res.xlsx')
-        cur = self.con.cursor()
-        sh = wb.add_worksheet()
-        sh.write(0, 1, 'Имя')
-        sh.write(0, 2, 'Уровень')
-        sh.write(0, 3, 'Результат')
-        sh.write(0, 4, 'Время')
-        for i in range(len(self.games)):
-            name = cur.execute('''SELECT name FROM players
-            WHERE id = ''' + str(self.games[i][0])).fetchone()[0]
-            sh.write(i + 1, 0, i + 1)
-            sh.write(i + 1, 1, name)
-            d = {1: 'Легкий', 2: 'Средний', 3: 'Сложный'}
-            sh.write(i + 1, 2, d[self.games[i][1]])
-            d = {1: 'Победа', 0: 'Поражение'}
-            sh.write(i + 1, 3, d[self.games[i][2]])
-            sh.write(i + 1, 4, self.games[i][3])
-        wb.close()
+        self.export('res.xlsx', 'xlsx')
+    
+    def convert_to_csv(self):
+        '''Make CSV file from games'''
+        self.export('res.csv', 'csv')
+    
+    def export(self, path, kind):
+        '''Starts export of games shown in statistics to file path in background'''
+        if (self.export_thread is not None) and self.export_thread.isRunning():
+            return
+        self.export_thread = ExportThread(DB_PATH, self.filters, path, kind)
+        self.export_thread.progress.connect(self.export_progress)
+        self.export_thread.saved.connect(lambda path: self.statusBar().showMessage('Сохранено в ' + path))
+        self.export_thread.error.connect(lambda message: self.statusBar().showMessage('Не удалось сохранить: ' + message))
+        self.export_thread.start()
+    
+    def export_progress(self, rows, total):
+        '''Shows progress of export'''
+        self.statusBar().showMessage('Сохранение: ' + str(rows) + ' из ' + str(total))
+    
+    def closeEvent(self, event):
+        if self.export_thread is not None:
+            self.export_thread.wait()
+        self.results.close()
+        self.con.close()
+        if self.timings_path is not None:
+            self.timings.dump(self.timings_path)
+        super().closeEvent(event)
     
     def filtrate(self):
         '''Filtrate games in statistics'''
-        cur = self.con.cursor()
-        self.games = cur.execute('SELECT * FROM games').fetchall()
-        if self.player_name.text() != '':
-            self.games = list(filter(lambda x: self.player_name.text() == cur.execute('''
-            SELECT name FROM players
-            WHERE id = ''' + str(x[0])).fetchone()[0], self.games))
-        levels = [1, 2, 3]
+        levels = None
         if self.r1.isChecked():
             levels = [1]
         elif self.r2.isChecked():
             levels = [2]
         elif self.r3.isChecked():
             levels = [3]
-        self.games = list(filter(lambda x: x[1] in levels, self.games))
-        results = [0, 1]
+        results = None
         if self.r4.isChecked():
             results = [1]
         elif self.r5.isChecked():
             results = [0]
-        self.games = list(filter(lambda x: x[2] in results, self.games))
+        time_operator = None
+        time = None
         try:
+            time = int(self.time_line.text())
             if self.r6.isChecked():
-                self.games = list(filter(lambda x: x[3] > int(self.time_line.text()), self.games))
+                time_operator = '>'
             elif self.r7.isChecked():
-                self.games = list(filter(lambda x: x[3] < int(self.time_line.text()), self.games))
+                time_operator = '<'
             else:
-                self.games = list(filter(lambda x: x[3] == int(self.time_line.text()), self.games))
+                time_operator = '='
         except ValueError:
-            self.draw_games()
-            return
+            pass
+        self.filters = (self.player_name.text(), levels, results, time_operator, time)
         self.draw_games()
         
     def draw_games(self):
         '''Display table of games on screen'''
-        cur = self.con.cursor()
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels(['Имя', 'Уровень', 'Результат', 'Время'])
-        self.table.setRowCount(len(self.games))
-        for i in range(len(self.games)):
-            name = cur.execute('''SELECT name FROM players
-            WHERE id = ''' + str(self.games[i][0])).fetchone()[0]
-            self.table.setItem(i, 0, QTableWidgetItem('  ' + name + '  '))
-            d = {1: '  Легкий  ', 2: '  Средний  ', 3: '  Сложный  '}
-            self.table.setItem(i, 1, QTableWidgetItem(d[self.games[i][1]]))
-            d = {1: '  Победа  ', 0: '  Поражение  '}
-            self.table.setItem(i, 2, QTableWidgetItem(d[self.games[i][2]]))
-            self.table.setItem(i, 3, QTableWidgetItem(str(self.games[i][3])))
-        self.table.resizeColumnsToContents()
-        self.table.resizeRowsToContents()
+        self.games = GamesModel(self.con, self.filters)
+        self.table.setModel(self.games)
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.table.setSortingEnabled(True)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+    
+    def draw_leaders(self):
+        '''Display table of results of players by levels'''
+        rows = leaderboard(self.con)
+        self.leaders.setColumnCount(8)
+        self.leaders.setHorizontalHeaderLabels(['Имя', 'Уровень', 'Игр', 'Побед', 'Лучшее',
+                                                'Среднее', 'Медиана', '90%'])
+        self.leaders.setRowCount(len(rows))
+        for i, (name, level, size, bombs, games, wins, rate, best, mean, p50, p90) in enumerate(rows):
+            texts = [name, level_name(level, size, bombs), str(games), str(round(rate * 100)) + '%']
+            for time in (best, mean, p50, p90):
+                texts.append('' if time is None else str(round(time)))
+            for j, text in enumerate(texts):
+                self.leaders.setItem(i, j, QTableWidgetItem(text))
+        self.leaders.resizeColumnsToContents()
     
     def init_game(self):
         '''Initialize game'''
-        self.user_name = self.line.text()
-        if self.easy.isChecked():
-            self.last_level = 1
-        elif self.medium.isChecked():
-            self.last_level = 2
-        else:
-            self.last_level = 3        
+        self.save_choice()
         self.check_user(self.user_name)
         self.time = 0
         self.timer = QTimer()
         self.timer.timeout.connect(self.on_timer)
         self.timer.start(1000)
-        self.level = 0
-        self.bombs_last = 0
-        if self.easy.isChecked():
-            self.pole = Pole(LEVELS[0])
-            self.size = LEVELS[0][1]
-            self.level = 1
-            self.bombs_last = LEVELS[0][2]
-        elif self.medium.isChecked():
-            self.pole = Pole(LEVELS[1])
-            self.size = LEVELS[1][1]
-            self.level = 2
-            self.bombs_last = LEVELS[1][2]
+        self.level = self.last_level
+        if self.level == CUSTOM_LEVEL:
+            level = self.custom_level
         else:
-            self.pole = Pole(LEVELS[2])
-            self.size = LEVELS[2][1]
-            self.level = 3
-            self.bombs_last = LEVELS[2][2]
+            level = LEVELS[self.level - 1]
+        try:
+            with self.timings.measure("new_pole"):
+                self.pole = Pole(level, first_click="safe")
+        except ValueError:
+            self.timer.stop()
+            self.statusBar().showMessage('Слишком много бомб для такого поля')
+            return
+        self.size = level[1]
+        self.bombs_last = level[2]
         self.game_now = True
-        uic.loadUi('designGame.ui', self)
-        width = 25 * self.size + 40
-        height = 25 * self.size + 180
+        load_ui('designGame.ui', self)
+        self.buttons = []
+        self.view = None
+        if self.level == CUSTOM_LEVEL:
+            self.side = min(CELL_SIZE * self.size, BOARD_SIDE)
+        else:
+            self.side = CELL_SIZE * self.size
+        width = self.side + 40
+        height = self.side + 180
         self.setGeometry(300, 300, width, height)
         self.setMinimumSize(width, height)
         self.setMaximumSize(width, height)
-        self.pushButton.resize(3 / 4 * self.size * 25, self.pushButton.height())
-        self.pushButton.move((width - self.pushButton.width()) / 2,
+        self.pushButton.resize(3 * self.side // 4, self.pushButton.height())
+        self.pushButton.move((width - self.pushButton.width()) // 2,
                              height - self.pushButton.height() - 30)
-        self.buttons = []
         self.pushButton.clicked.connect(self.init_start_after_game)
+        if self.level == CUSTOM_LEVEL:
+            self.view = BoardView(self.centralWidget(), self)
+            self.view.setGeometry(20, 20, self.side, self.side)
+        else:
+            self.init_buttons()
+        self.time_label.move(width // 2 - 50, self.side + 25)
+        self.bomb_label.move(width // 2 - 80, self.side + 63)
+        self.bomb_label.setText('Осталось бомб: ' + str(self.bombs_last))
+        self.solver = Solver(self.pole)
+        self.replay = Replay(self.size, level[2])
+        # Timer of game is started already, time before the first click is in replay too
+        self.replay.start()
+        self.hint_cell = None
+        hint = self.menuBar().addAction('Подсказка')
+        hint.setShortcut('H')
+        hint.triggered.connect(self.show_hint)
+        self.timings_label = None
+        if self.timings.enabled:
+            self.init_timings_label()
+    
+    def init_timings_label(self):
+        '''Creates overlay with durations of stages of clicks, it is hidden and shown by menu'''
+        self.timings_label = QLabel(self.centralWidget())
+        self.timings_label.setStyleSheet('background-color: rgba(255, 255, 255, 200); font-size: 10px')
+        self.timings_label.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.timings_label.move(20, 20)
+        self.draw_timings()
+        self.timings_label.show()
+        overlay = self.menuBar().addAction('Замеры')
+        overlay.setShortcut('T')
+        overlay.triggered.connect(lambda: self.timings_label.setVisible(not self.timings_label.isVisible()))
+    
+    def draw_timings(self):
+        '''Shows durations of stages: amount, mean, p50, p95 and maximum'''
+        if (self.timings_label is None) or not self.timings_label.isVisible():
+            return
+        lines = self.timings.summary() or ['Замеров пока нет']
+        self.timings_label.setText('\n'.join(['этап: кол-во × среднее / p50 / p95 / макс'] + lines))
+        self.timings_label.adjustSize()
+        self.timings_label.raise_()
+    
+    def init_buttons(self):
+        '''Creates button for every cell of pole'''
         self.grid.setColumnStretch(self.size, self.size)
         self.grid.setRowStretch(self.size, self.size)
         self.grid.setHorizontalSpacing(0)
@@ -330,16 +566,13 @@ class Game(QMainWindow):
         for i in range(self.size):
             self.buttons.append([])
             for j in range(self.size):
-                self.buttons[-1].append(PushButtonRight(' ', self))
-                self.buttons[i][j].setIcon(QIcon("cell.jpg"))
+                self.buttons[-1].append(PushButtonRight(' ', self, i, j))
+                self.buttons[i][j].setIcon(get_icon("cell.jpg"))
                 self.buttons[i][j].setIconSize(QSize(29, 25))                   
                 self.buttons[i][j].resize(25, 25)
                 self.buttons[i][j].setMinimumSize(25, 25)
                 self.buttons[i][j].setMaximumSize(25, 25)
                 self.grid.addWidget(self.buttons[i][j], j, i)
-        self.time_label.move(width / 2 - 50, 25 * self.size + 25)
-        self.bomb_label.move(width / 2 - 80, 25 * self.size + 63)
-        self.bomb_label.setText('Осталось бомб: ' + str(self.bombs_last))
     
     def init_start_after_game(self):
         '''Initialize start menu after game'''
@@ -359,154 +592,157 @@ class Game(QMainWindow):
     
     def check_user(self, name):
         '''If user name not in database create it'''
-        cur = self.con.cursor()
-        mass = cur.execute('''SELECT id FROM players
-        WHERE name = "''' + name + '"').fetchall()
-        if len(mass) == 0:
-            cur.execute('INSERT INTO players(name) VALUES("' + name + '")')
-            self.con.commit()
-    
-    def game_click(self, send, but):
-        '''Process clicks in game'''
+        add_player(self.con, name)
+        self.con.commit()
+    
+    def game_click(self, x, y, but):
+        '''Process clicks in cell(x, y) in game'''
         if not self.game_now:
             return
-        x = 0
-        y = 0
-        for i in range(self.size):
-            for j in range(self.size):
-                if self.buttons[i][j] == send:
-                    x = i
-                    y = j
-                    break
+        with self.timings.measure("click"):
+            self.make_move(x, y, but)
+        self.draw_timings()
+    
+    def make_move(self, x, y, but):
+        '''Makes move in cell(x, y) and draws its result, stages are recorded in timings'''
+        timings = self.timings
+        changed = []
         if but == "r":
-            info = self.pole.get_info_cell(x, y)
-            if "Flag" in info:
-                del info[info.index("Flag")]
-                info.append("Question")
-                self.bombs_last += 1
-                self.bomb_label.setText('Осталось бомб: ' + str(self.bombs_last))
-            elif "Question" in info:
-                del info[info.index("Question")]
-            else:
-                if self.bombs_last > 0:
-                    info.append("Flag")
-                    self.bombs_last -= 1
-                    self.bomb_label.setText('Осталось бомб: ' + str(self.bombs_last))
-                else:
-                    info.append("Question")
-            self.pole.set_info_cell(x, y, info)
+            with timings.measure("move"):
+                info = self.pole.toggle_mark(x, y)
+            if info is not None:
+                self.replay.record(MARK_MOVE, x, y)
+                changed = [(x, y)]
         else:
             info = self.pole.get_info_cell(x, y)
-            if ("Flag" not in info) and ("Question" not in info):
-                if not self.pole.move(x, y):
+            # Click on opened or marked cell changes nothing, so it is not recorded
+            if ("Close" in info) and ("Flag" not in info) and ("Question" not in info):
+                self.replay.record(OPEN_MOVE, x, y)
+                if not self.pole.generated:
+                    with timings.measure("place_bombs"):
+                        self.pole.place_bombs(x, y)
+                with timings.measure("move"):
+                    changed = self.pole.move(x, y)
+                if changed is False:
                     self.failed(x, y)
                     return
-                if self.pole.check_win():
+                self.solver.update(changed)
+                with timings.measure("win_check"):
+                    won = self.pole.check_win()
+                if won:
                     self.win()
                     return
-            self.bombs_last = {1: 10, 2: 40, 3: 99}[self.level]
-            for i in range(self.size):
-                for j in range(self.size):
-                    if 'Flag' in self.pole.get_info_cell(i, j):
-                        self.bombs_last -= 1
-            self.bomb_label.setText('Осталось бомб: ' + str(self.bombs_last))
-        self.draw()
+        self.bombs_last = self.pole.get_bombs_last()
+        self.bomb_label.setText('Осталось бомб: ' + str(self.bombs_last))
+        with timings.measure("draw"):
+            self.draw(changed)
+    
+    def show_hint(self):
+        '''Shows cell suggested by solver'''
+        if not self.game_now:
+            return
+        # Solver processes moves made since last hint only now
+        with self.timings.measure("solver"):
+            x, y, kind = self.solver.hint()
+        texts = {"safe": 'безопасна', "mine": 'заминирована', "guess": 'вероятно безопасна'}
+        self.statusBar().showMessage('Подсказка: клетка ' + str(x + 1) + ', ' + str(y + 1) +
+                                     ' ' + texts[kind])
+        color = "#c00000" if kind == "mine" else "#00a000"
+        if self.view is not None:
+            self.view.show_hint(x, y, color)
+            return
+        self.clear_hint()
+        self.hint_cell = (x, y)
+        self.buttons[x][y].setStyleSheet('border: 2px solid ' + color)
+    
+    def clear_hint(self):
+        '''Removes frame of hint from button'''
+        if self.hint_cell is not None:
+            self.buttons[self.hint_cell[0]][self.hint_cell[1]].setStyleSheet('')
+            self.hint_cell = None
+    
+    def save_replay(self):
+        '''Saves replay of finished game, returns name of its file or None if it is not written'''
+        self.replay.mines = self.pole.get_mines()
+        try:
+            with self.timings.measure("save_replay"):
+                return self.replay.save(replays_dir(DB_PATH))
+        except OSError as error:
+            # Result of game is written without replay
+            self.statusBar().showMessage('Не удалось сохранить запись партии: ' + str(error))
+            return None
     
     def win(self):
         '''Process end of game, when player win'''
         self.game_now = False
         self.timer.stop()
-        cur = self.con.cursor()
-        p_id = cur.execute('''SELECT id FROM players
-        WHERE name = "''' + self.user_name + '"').fetchone()[0]
-        cur.execute('INSERT INTO games VALUES(' + str(p_id) +
-                    ', ' + str(self.level) + ', 1, ' + str(self.time) + ')')
-        self.con.commit()
-        self.win_draw()
+        self.results.add(self.user_name, self.level, 1, self.time, self.save_replay(),
+                         self.size, self.pole.bombs_amount)
+        with self.timings.measure("end_draw"):
+            self.win_draw()
     
     def win_draw(self):
         '''Draw end pole of game, when player win'''
         self.bomb_label.setText('Вы выиграли')
-        width = 25 * self.size + 40
-        self.bomb_label.move(width / 2 - 60, 25 * self.size + 63)
+        width = self.side + 40
+        self.bomb_label.move(width // 2 - 60, self.side + 63)
+        if self.view is not None:
+            self.view.show_end(True)
+            return
         for i in range(self.size):
             for j in range(self.size):
                 info = self.pole.get_info_cell(i, j)
                 if "Bomb" in info:
-                    self.buttons[i][j].setIcon(QIcon("bomb2.jpg"))
-                    self.buttons[i][j].setIconSize(QSize(29, 25))
+                    self.buttons[i][j].setIcon(get_icon("bomb2.jpg"))
                 else:
-                    self.buttons[i][j].setIcon(QIcon("0.jpg"))
+                    self.buttons[i][j].setIcon(get_icon("0.jpg"))
                     self.buttons[i][j].setEnabled(False)
     
     def failed(self, x, y):
         '''Process end of game, when player lose'''
         self.game_now = False
         self.timer.stop()
-        self.end_draw(x, y)
-        cur = self.con.cursor()
-        p_id = cur.execute('''SELECT id FROM players
-        WHERE name = "''' + self.user_name + '"').fetchone()[0]
-        cur.execute('INSERT INTO games VALUES(' + str(p_id) + ', ' + 
-                    str(self.level) + ', 0, ' + str(self.time) + ')')
-        self.con.commit()        
+        with self.timings.measure("end_draw"):
+            self.end_draw(x, y)
+        self.results.add(self.user_name, self.level, 0, self.time, self.save_replay(),
+                         self.size, self.pole.bombs_amount)
     
     def end_draw(self, x, y):
         '''Draw end pole of game, when player lose'''
         self.bomb_label.setText('Вы проиграли')
-        width = 25 * self.size + 40
-        self.bomb_label.move(width / 2 - 65, 25 * self.size + 63)
+        width = self.side + 40
+        self.bomb_label.move(width // 2 - 65, self.side + 63)
+        if self.view is not None:
+            self.view.show_end(False, x, y)
+            return
         for i in range(self.size):
             for j in range(self.size):
                 info = self.pole.get_info_cell(i, j)
                 if (i == x) and (j == y):
-                    self.buttons[i][j].setIcon(QIcon("bomb1.jpg"))
-                    self.buttons[i][j].setIconSize(QSize(29, 25))
+                    self.buttons[i][j].setIcon(get_icon("bomb1.jpg"))
                     continue
                 if "Bomb" in info:
-                    self.buttons[i][j].setIcon(QIcon("bomb.jpg"))
-                    self.buttons[i][j].setIconSize(QSize(29, 25))                    
+                    self.buttons[i][j].setIcon(get_icon("bomb.jpg"))
     
-    def draw(self):
-        '''Draw pole in game'''
-        for i in range(self.size):
-            for j in range(self.size):
-                info = self.pole.get_info_cell(i, j)
-                if "Close" in info:
-                    if "Flag" in info:
-                        self.buttons[i][j].setIcon(QIcon("flag.jpg"))
-                        self.buttons[i][j].setIconSize(QSize(29, 25))
-                    elif "Question" in info:
-                        self.buttons[i][j].setIcon(QIcon("question.jpg"))
-                        self.buttons[i][j].setIconSize(QSize(29, 25))
-                    else:
-                        self.buttons[i][j].setIcon(QIcon("cell.jpg"))
-                        self.buttons[i][j].setIconSize(QSize(29, 25))                         
-                else:
-                    if self.pole.get_bombs_near_cell(i, j) == 0:
-                        self.buttons[i][j].setIcon(QIcon("0.jpg"))
-                    elif self.pole.get_bombs_near_cell(i, j) == 1:
-                        self.buttons[i][j].setIcon(QIcon("1.jpg"))
-                        self.buttons[i][j].setIconSize(QSize(29, 25)) 
-                    elif self.pole.get_bombs_near_cell(i, j) == 2:
-                        self.buttons[i][j].setIcon(QIcon("2.jpg"))
-                        self.buttons[i][j].setIconSize(QSize(29, 25))
-                    elif self.pole.get_bombs_near_cell(i, j) == 3:
-                        self.buttons[i][j].setIcon(QIcon("3.jpg"))
-                        self.buttons[i][j].setIconSize(QSize(29, 25))
-                    elif self.pole.get_bombs_near_cell(i, j) == 4:
-                        self.buttons[i][j].setIcon(QIcon("4.jpg"))
-                        self.buttons[i][j].setIconSize(QSize(29, 25))   
-                    elif self.pole.get_bombs_near_cell(i, j) == 5:
-                        self.buttons[i][j].setIcon(QIcon("5.jpg"))
-                        self.buttons[i][j].setIconSize(QSize(29, 25))
-                    else:
-                        self.buttons[i][j].setIcon(QIcon("6.jpg"))
-                        self.buttons[i][j].setIconSize(QSize(29, 25))                        
-                    self.buttons[i][j].setEnabled(False)
-        
+    def draw(self, cells):
+        '''Draw changed cells (x, y) of pole in game'''
+        if self.view is not None:
+            self.view.clear_hint()
+            self.view.update_cells(cells)
+            return
+        self.clear_hint()
+        for i, j in cells:
+            self.buttons[i][j].setIcon(get_icon(cell_icon_name(self.pole, i, j)))
+            if "Open" in self.pole.get_info_cell(i, j):
+                self.buttons[i][j].setEnabled(False)
+
 
-app = QApplication(sys.argv)
-ex = Game()
-ex.show()
-sys.exit(app.exec_())
\ No newline at end of file
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Minesweeper')
+    parser.add_argument('--timings', default=os.environ.get(ENVIRONMENT_VARIABLE),
+                        help='JSON file for durations of stages of clicks, written on exit')
+    args, qt_args = parser.parse_known_args()
+    app = QApplication(sys.argv[:1] + qt_args)
+    ex = Game(args.timings)
+    ex.show()
+    sys.exit(app.exec_())
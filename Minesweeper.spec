@@ -2,32 +2,44 @@
 
 block_cipher = None
 
+# Images and forms are loaded from directory of build (RESOURCES_DIR of Minesweeper.py)
+resources = [(name, '.') for name in ('designStart.ui', 'designStatistic.ui', 'designGame.ui',
+                                      '0.jpg', '1.jpg', '2.jpg', '3.jpg', '4.jpg', '5.jpg', '6.jpg',
+                                      'cell.jpg', 'flag.jpg', 'question.jpg',
+                                      'bomb.jpg', 'bomb1.jpg', 'bomb2.jpg')]
+
 
 a = Analysis(['Minesweeper.py'],
              pathex=['C:\\Users\\igorm\\Documents\\Git\\Minesweeper'],
              binaries=[],
-             datas=[],
+             datas=resources,
              hiddenimports=[],
              hookspath=[],
              runtime_hooks=[],
-             excludes=[],
+             excludes=['tkinter'],
              win_no_prefer_redirects=False,
              win_private_assemblies=False,
              cipher=block_cipher,
              noarchive=False)
 pyz = PYZ(a.pure, a.zipped_data,
              cipher=block_cipher)
+# Build is a directory: one-file build unpacks all libraries to temporary directory
+# on every start, and libraries compressed by UPX are unpacked on every load
 exe = EXE(pyz,
           a.scripts,
-          a.binaries,
-          a.zipfiles,
-          a.datas,
           [],
+          exclude_binaries=True,
           name='Minesweeper',
           debug=False,
           bootloader_ignore_signals=False,
           strip=False,
-          upx=True,
-          upx_exclude=[],
-          runtime_tmpdir=None,
+          upx=False,
           console=False )
+coll = COLLECT(exe,
+               a.binaries,
+               a.zipfiles,
+               a.datas,
+               strip=False,
+               upx=False,
+               upx_exclude=[],
+               name='Minesweeper')
@@ -0,0 +1,213 @@
+# -*- coding: utf8 -*-
+'''Microbenchmarks of hot paths of Pole and of redraw of game window on offscreen Qt platform
+Prints JSON with time and peak memory of every case, compares it with baseline if it is given
+Peak memory is measured with tracemalloc, which makes pure Python cases of large poles
+many times slower, --no-memory skips it
+
+Example: python benchmark.py --output baseline.json
+         python benchmark.py --baseline baseline.json'''
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import tracemalloc
+from statistics import median
+from time import perf_counter
+import pole as pole_module
+from pole import Pole, LEVELS, BOMB, OPEN
+
+# Levels of cases: all LEVELS and large custom poles with density of bombs of Hard level
+CUSTOM_SIZES = (100, 500, 1000)
+# Calls of check_win in one run, single call is too short to measure
+WIN_CHECKS = 10000
+# Clicks made in every case of game_click
+GUI_CLICKS = 50
+# Runs of case stop after this time in seconds, so that slow cases of large poles finish
+MAX_CASE_TIME = 2
+# Case is slower than baseline if its time grew more than by this part
+TOLERANCE = 0.2
+
+
+def custom_level(size):
+    '''Returns custom level with pole size x size'''
+    return ("Custom", size, size * size * 99 // (24 * 24))
+
+
+def measure(function, repeat, memory=True):
+    '''Runs function repeat times or until MAX_CASE_TIME is spent, returns dict with median
+    and minimal time in seconds and, if memory, peak memory in bytes allocated by Python
+    during one more run'''
+    times = []
+    while len(times) < repeat and sum(times) < MAX_CASE_TIME:
+        start = perf_counter()
+        function()
+        times.append(perf_counter() - start)
+    result = {"time": median(times), "min_time": min(times), "repeat": len(times)}
+    if memory:
+        tracemalloc.start()
+        function()
+        result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def sparse_pole(size):
+    '''Returns pole with the only bomb in the last corner: move in (0, 0) opens all other cells,
+    so it is the worst case of open_cells'''
+    return Pole(("Sparse", size, 1), mines=[size * size - 1])
+
+
+def pole_cases(level, repeat, memory):
+    '''Returns dict: name of case -> result of measure for hot paths of Pole on level'''
+    results = {}
+    pole = Pole(level, seed=0)
+    results["generate_pole"] = measure(pole.generate_pole, repeat, memory)
+    results["set_bombs_near"] = measure(pole.set_bombs_near, repeat, memory)
+    if pole_module.get_numpy() is not None:
+        results["set_bombs_near_python"] = measure(pole.set_bombs_near_python, repeat, memory)
+    sparse = [sparse_pole(level[1]) for i in range(repeat + 1)]
+
+    def open_cells():
+        sparse.pop().move(0, 0)
+
+    results["open_cells_sparse"] = measure(open_cells, repeat, memory)
+
+    def check_win():
+        for i in range(WIN_CHECKS):
+            pole.check_win()
+
+    results["check_win"] = measure(check_win, repeat, memory)
+    return results
+
+
+def click_cells(pole, amount):
+    '''Returns list of amount closed cells without bombs spread over pole'''
+    size = pole.size
+    cells = []
+    step = max(size * size // (amount * 2), 1)
+    for k in range(0, size * size, step):
+        if not pole.state[k] & (BOMB | OPEN):
+            cells.append(divmod(k, size))
+        if len(cells) == amount:
+            break
+    return cells
+
+
+def gui_cases(level_number, level, repeat, memory):
+    '''Returns dict: name of case -> result of measure for game_click and draw of
+    game window on level, game_click opens closed cells and includes processing of paint events'''
+    import Minesweeper
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication(sys.argv)
+    results = {}
+    game = Minesweeper.Game()
+    game.last_level = level_number
+    game.custom_level = level
+    game.show()
+
+    def start():
+        # Start menu shows level of the last game, so it is chosen again
+        game.init_start()
+        game.init_game()
+        game.pole.random.seed(0)
+        game.pole.place_bombs()
+        app.processEvents()
+        return click_cells(game.pole, GUI_CLICKS)
+
+    cells = start()
+    times = []
+    while len(times) < repeat and sum(times) < MAX_CASE_TIME:
+        # Cells opened by previous clicks are skipped
+        while cells and game.pole.state[game.pole.index(*cells[-1])] & OPEN:
+            cells.pop()
+        if not cells or not game.game_now:
+            game.timer.stop()
+            cells = start()
+        x, y = cells.pop()
+        time = perf_counter()
+        game.game_click(x, y, "l")
+        app.processEvents()
+        times.append(perf_counter() - time)
+    results["game_click"] = {"time": median(times), "min_time": min(times), "repeat": len(times)}
+    cells = [(x, y) for x in range(level[1]) for y in range(level[1])]
+
+    def draw():
+        game.draw(cells)
+        app.processEvents()
+
+    results["draw_all"] = measure(draw, repeat, memory)
+    game.timer.stop()
+    game.close()
+    return results
+
+
+def run(levels, repeat, gui, memory):
+    '''Returns dict: "case/level" -> result of measure'''
+    results = {}
+    for number, level in levels:
+        for name, result in pole_cases(level, repeat, memory).items():
+            results[name + "/" + level[0] + str(level[1])] = result
+        if gui:
+            for name, result in gui_cases(number, level, repeat, memory).items():
+                results[name + "/" + level[0] + str(level[1])] = result
+    return results
+
+
+def compare(results, baseline, tolerance):
+    '''Prints ratio of minimal time of every case to minimal time of baseline, as minimal time
+    depends less on other processes than median
+    Returns list of names of cases which are slower than baseline more than by tolerance'''
+    slower = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        ratio = result["min_time"] / max(baseline[name]["min_time"], 1e-9)
+        mark = ''
+        if ratio > 1 + tolerance:
+            slower.append(name)
+            mark = '  SLOWER'
+        print(name + ': ' + format(ratio, '.2f') + 'x' + mark, file=sys.stderr)
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks hot paths of Minesweeper')
+    parser.add_argument('--repeat', type=int, default=20, help='runs of every case')
+    parser.add_argument('--sizes', default=','.join(map(str, CUSTOM_SIZES)),
+                        help='sizes of custom poles separated by commas, may be empty')
+    parser.add_argument('--no-gui', action='store_true', help='do not benchmark game window')
+    parser.add_argument('--no-memory', action='store_true', help='do not measure peak memory')
+    parser.add_argument('--output', help='file for JSON results, stdout by default')
+    parser.add_argument('--baseline', help='JSON results to compare with')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='allowed growth of time, part of time of baseline')
+    args = parser.parse_args(argv)
+    levels = [(i + 1, level) for i, level in enumerate(LEVELS)]
+    levels += [(4, custom_level(int(size))) for size in args.sizes.split(',') if size]
+    gui = not args.no_gui
+    if gui:
+        # Game uses images from directory of program, results go to temporary database
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        import Minesweeper
+        directory = tempfile.mkdtemp()
+        Minesweeper.DB_PATH = os.path.join(directory, 'games.db')
+    report = {"python": platform.python_version(), "numpy": pole_module.get_numpy() is not None,
+              "results": run(levels, args.repeat, gui, not args.no_memory)}
+    text = json.dumps(report, indent=1, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        if compare(report["results"], baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,314 @@
+# -*- coding: utf8 -*-
+'''Database of players and games: schema migrations and queries'''
+import sqlite3
+import sys
+import threading
+from queue import Queue, Empty
+from time import sleep
+from timings import Timings
+
+# Migrations by version of schema, version is kept in PRAGMA user_version
+MIGRATIONS = [
+    '''CREATE TABLE IF NOT EXISTS players (id INTEGER UNIQUE NOT NULL PRIMARY KEY AUTOINCREMENT,
+    name STRING NOT NULL);
+    CREATE TABLE IF NOT EXISTS games (player_id INTEGER NOT NULL, level INTEGER NOT NULL,
+    win BOOLEAN NOT NULL, time INTEGER NOT NULL);''',
+    '''CREATE INDEX IF NOT EXISTS games_player_level_win_time ON games(player_id, level, win, time);
+    CREATE INDEX IF NOT EXISTS players_name ON players(name);''',
+    # Indexes for sorting of statistics table without sorting all games
+    '''CREATE INDEX IF NOT EXISTS games_level ON games(level);
+    CREATE INDEX IF NOT EXISTS games_win ON games(win);
+    CREATE INDEX IF NOT EXISTS games_time ON games(time);''',
+    # Aggregates by player and level, kept up to date by trigger on every new game,
+    # win_times is histogram of times of won games for percentiles
+    '''CREATE TABLE IF NOT EXISTS player_stats (player_id INTEGER NOT NULL, level INTEGER NOT NULL,
+    games INTEGER NOT NULL, wins INTEGER NOT NULL, best_time INTEGER, total_time INTEGER NOT NULL,
+    PRIMARY KEY (player_id, level));
+    CREATE TABLE IF NOT EXISTS win_times (player_id INTEGER NOT NULL, level INTEGER NOT NULL,
+    time INTEGER NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (player_id, level, time));
+    INSERT OR IGNORE INTO player_stats SELECT player_id, level, COUNT(*), SUM(win),
+    MIN(CASE WHEN win THEN time END), SUM(CASE WHEN win THEN time ELSE 0 END)
+    FROM games GROUP BY player_id, level;
+    INSERT OR IGNORE INTO win_times SELECT player_id, level, time, COUNT(*)
+    FROM games WHERE win GROUP BY player_id, level, time;
+    CREATE TRIGGER IF NOT EXISTS games_aggregates AFTER INSERT ON games
+    BEGIN
+        INSERT OR IGNORE INTO player_stats VALUES (NEW.player_id, NEW.level, 0, 0, NULL, 0);
+        UPDATE player_stats SET games = games + 1, wins = wins + NEW.win,
+        best_time = CASE WHEN NEW.win AND (best_time IS NULL OR NEW.time < best_time)
+        THEN NEW.time ELSE best_time END,
+        total_time = total_time + CASE WHEN NEW.win THEN NEW.time ELSE 0 END
+        WHERE player_id = NEW.player_id AND level = NEW.level;
+        INSERT OR IGNORE INTO win_times SELECT NEW.player_id, NEW.level, NEW.time, 0 WHERE NEW.win;
+        UPDATE win_times SET count = count + 1
+        WHERE NEW.win AND player_id = NEW.player_id AND level = NEW.level AND time = NEW.time;
+    END;''',
+    # File name of replay of game in directory of replays
+    '''ALTER TABLE games ADD COLUMN replay TEXT;''',
+    # Side of pole and amount of bombs, games of custom level written before are left without them
+    '''ALTER TABLE games ADD COLUMN size INTEGER;
+    ALTER TABLE games ADD COLUMN bombs INTEGER;
+    UPDATE games SET size = 8, bombs = 10 WHERE level = 1;
+    UPDATE games SET size = 16, bombs = 40 WHERE level = 2;
+    UPDATE games SET size = 24, bombs = 99 WHERE level = 3;''',
+    # Aggregates are kept by size of pole and amount of bombs too, so results of different custom
+    # poles are not mixed, games without size (custom games before migration 6) are not counted
+    '''DROP TRIGGER IF EXISTS games_aggregates;
+    DROP TABLE IF EXISTS player_stats;
+    DROP TABLE IF EXISTS win_times;
+    CREATE TABLE player_stats (player_id INTEGER NOT NULL, level INTEGER NOT NULL,
+    size INTEGER NOT NULL, bombs INTEGER NOT NULL,
+    games INTEGER NOT NULL, wins INTEGER NOT NULL, best_time INTEGER, total_time INTEGER NOT NULL,
+    PRIMARY KEY (player_id, level, size, bombs));
+    CREATE TABLE win_times (player_id INTEGER NOT NULL, level INTEGER NOT NULL,
+    size INTEGER NOT NULL, bombs INTEGER NOT NULL, time INTEGER NOT NULL, count INTEGER NOT NULL,
+    PRIMARY KEY (player_id, level, size, bombs, time));
+    INSERT INTO player_stats SELECT player_id, level, size, bombs, COUNT(*), SUM(win),
+    MIN(CASE WHEN win THEN time END), SUM(CASE WHEN win THEN time ELSE 0 END)
+    FROM games WHERE size IS NOT NULL GROUP BY player_id, level, size, bombs;
+    INSERT INTO win_times SELECT player_id, level, size, bombs, time, COUNT(*)
+    FROM games WHERE win AND size IS NOT NULL GROUP BY player_id, level, size, bombs, time;
+    CREATE TRIGGER games_aggregates AFTER INSERT ON games WHEN NEW.size IS NOT NULL
+    BEGIN
+        INSERT OR IGNORE INTO player_stats VALUES (NEW.player_id, NEW.level, NEW.size, NEW.bombs,
+        0, 0, NULL, 0);
+        UPDATE player_stats SET games = games + 1, wins = wins + NEW.win,
+        best_time = CASE WHEN NEW.win AND (best_time IS NULL OR NEW.time < best_time)
+        THEN NEW.time ELSE best_time END,
+        total_time = total_time + CASE WHEN NEW.win THEN NEW.time ELSE 0 END
+        WHERE player_id = NEW.player_id AND level = NEW.level AND size = NEW.size AND bombs = NEW.bombs;
+        INSERT OR IGNORE INTO win_times SELECT NEW.player_id, NEW.level, NEW.size, NEW.bombs, NEW.time, 0
+        WHERE NEW.win;
+        UPDATE win_times SET count = count + 1
+        WHERE NEW.win AND player_id = NEW.player_id AND level = NEW.level AND size = NEW.size
+        AND bombs = NEW.bombs AND time = NEW.time;
+    END;''',
+]
+# Results of games written by ResultWriter in one transaction at most
+WRITE_BATCH = 1000
+# Attempts to write one batch, database may be locked by other program for a while
+WRITE_ATTEMPTS = 3
+# Pause between attempts in seconds
+WRITE_RETRY_DELAY = 1
+# Comparisons for filter by time
+TIME_OPERATORS = ('>', '<', '=')
+# Names of levels and results of games
+LEVEL_NAMES = {1: 'Легкий', 2: 'Средний', 3: 'Сложный', 4: 'Свое поле'}
+RESULT_NAMES = {1: 'Победа', 0: 'Поражение'}
+# Number of custom level, its games are different only by size and bombs
+CUSTOM_LEVEL = 4
+# Columns of games query for ORDER BY
+SORT_COLUMNS = ('players.name', 'games.level', 'games.win', 'games.time')
+
+
+def split_script(script):
+    '''Returns list of SQL statements of script'''
+    statements = []
+    statement = ''
+    for line in script.splitlines(True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            statements.append(statement.strip())
+            statement = ''
+    return statements
+
+
+def migrate(con):
+    '''Brings schema of database to the last version'''
+    # Write lock is taken before reading version, so other connections
+    # do not apply the same migrations at the same time
+    con.execute('BEGIN IMMEDIATE')
+    version = con.execute('PRAGMA user_version').fetchone()[0]
+    for i in range(version, len(MIGRATIONS)):
+        for statement in split_script(MIGRATIONS[i]):
+            con.execute(statement)
+        con.execute('PRAGMA user_version = ' + str(i + 1))
+    con.commit()
+
+
+def connect(path='games.db'):
+    '''Returns connection to database with schema of the last version'''
+    con = sqlite3.connect(path)
+    # Readers do not wait for writer and commits do not wait for fsync of every transaction
+    con.execute('PRAGMA journal_mode = WAL')
+    con.execute('PRAGMA synchronous = NORMAL')
+    migrate(con)
+    return con
+
+
+def add_player(con, name):
+    '''Returns id of player with name, creating player if there is no such player'''
+    row = con.execute('SELECT id FROM players WHERE name = ?', (name,)).fetchone()
+    if row is not None:
+        return row[0]
+    return con.execute('INSERT INTO players(name) VALUES(?)', (name,)).lastrowid
+
+
+def level_name(level, size=None, bombs=None):
+    '''Returns name of level, with size of pole and amount of bombs for custom level if they are known'''
+    if level != CUSTOM_LEVEL or size is None:
+        return LEVEL_NAMES[level]
+    return LEVEL_NAMES[level] + ' ' + str(size) + '×' + str(size) + ', бомб: ' + str(bombs)
+
+
+def games_query(name='', levels=None, results=None, time_operator=None, time=None):
+    '''Returns (SQL, parameters) of query of games (name, level, win, time, size, bombs) with filters:
+    name of player if it is not empty, levels and results if they are not None,
+    time compared by time_operator if it is not None'''
+    conditions = []
+    parameters = []
+    if name:
+        conditions.append('players.name = ?')
+        parameters.append(name)
+    if levels is not None:
+        conditions.append('games.level IN (' + ', '.join('?' * len(levels)) + ')')
+        parameters.extend(levels)
+    if results is not None:
+        conditions.append('games.win IN (' + ', '.join('?' * len(results)) + ')')
+        parameters.extend(results)
+    if time_operator is not None:
+        if time_operator not in TIME_OPERATORS:
+            raise ValueError('Unknown comparison: ' + str(time_operator))
+        conditions.append('games.time ' + time_operator + ' ?')
+        parameters.append(time)
+    sql = '''SELECT players.name, games.level, games.win, games.time, games.size, games.bombs FROM games
+    JOIN players ON players.id = games.player_id'''
+    if conditions:
+        sql += '\n    WHERE ' + ' AND '.join(conditions)
+    return sql, parameters
+
+
+def games_cursor(con, filters=(), column=None, descending=False):
+    '''Returns cursor of games (name, level, win, time, size, bombs) with filters (arguments of games_query)
+    sorted by column number of SORT_COLUMNS, or in order of adding if column is None'''
+    sql, parameters = games_query(*filters)
+    order = ' DESC' if descending else ''
+    if column is None:
+        sql += ' ORDER BY games.rowid' + order
+    else:
+        sql += ' ORDER BY ' + SORT_COLUMNS[column] + order + ', games.rowid' + order
+    return con.execute(sql, parameters)
+
+
+def count_games(con, filters=()):
+    '''Returns amount of games with filters (arguments of games_query)'''
+    sql, parameters = games_query(*filters)
+    return con.execute('SELECT COUNT(*) FROM (' + sql + ')', parameters).fetchone()[0]
+
+
+def percentiles(times, wins, parts):
+    '''Returns list of percentiles of times of wins from histogram times: list of (time, count)
+    sorted by time, parts are fractions, e. g. 0.5 for median'''
+    result = []
+    for part in parts:
+        # Nearest rank: the first time which covers part of all wins
+        rank = max(1, -(-wins * part // 1))
+        seen = 0
+        for time, count in times:
+            seen += count
+            if seen >= rank:
+                result.append(time)
+                break
+    return result
+
+
+def leaderboard(con):
+    '''Returns list of (name, level, size, bombs, games, wins, win rate, best time, mean time,
+    p50 time, p90 time) by player and pole, times are times of won games,
+    sorted by pole and best time'''
+    rows = con.execute('''SELECT player_stats.player_id, players.name, player_stats.level,
+    player_stats.size, player_stats.bombs, player_stats.games, player_stats.wins,
+    player_stats.best_time, player_stats.total_time
+    FROM player_stats JOIN players ON players.id = player_stats.player_id
+    ORDER BY player_stats.level, player_stats.size, player_stats.bombs,
+    player_stats.best_time IS NULL, player_stats.best_time''').fetchall()
+    histograms = {}
+    for player_id, level, size, bombs, time, count in con.execute('''SELECT player_id, level,
+    size, bombs, time, count FROM win_times ORDER BY player_id, level, size, bombs, time'''):
+        histograms.setdefault((player_id, level, size, bombs), []).append((time, count))
+    result = []
+    for player_id, name, level, size, bombs, games, wins, best, total in rows:
+        if wins:
+            p50, p90 = percentiles(histograms[(player_id, level, size, bombs)], wins, (0.5, 0.9))
+            mean = total / wins
+        else:
+            p50 = p90 = mean = None
+        result.append((name, level, size, bombs, games, wins, wins / games, best, mean, p50, p90))
+    return result
+
+
+class ResultWriter:
+    '''Writes results of games to database in background thread,
+    results which came while previous batch was written are committed together,
+    time of writing of every batch is recorded in timings as stage "db_write"
+    Batch which is not written after WRITE_ATTEMPTS attempts is reported to stderr and dropped,
+    so flush and close always return'''
+    def __init__(self, path='games.db', timings=None):
+        self.path = path
+        self.timings = timings if timings is not None else Timings(False)
+        self.queue = Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def add(self, name, level, win, time, replay=None, size=None, bombs=None):
+        '''Adds result of game to queue of writing, replay is file name of replay of game,
+        size and bombs are side of pole and amount of bombs'''
+        self.queue.put((name, level, win, time, replay, size, bombs))
+
+    def flush(self):
+        '''Waits until all added results are written'''
+        self.queue.join()
+
+    def close(self):
+        '''Writes all added results and stops thread'''
+        self.queue.put(None)
+        self.thread.join()
+
+    def write(self, con, players, games):
+        '''Writes games (name, level, win, time, replay, size, bombs) in one transaction,
+        players is cache: name -> id of player'''
+        rows = []
+        for name, level, win, time, replay, size, bombs in games:
+            if name not in players:
+                players[name] = add_player(con, name)
+            rows.append((players[name], level, win, time, replay, size, bombs))
+        con.executemany('''INSERT INTO games(player_id, level, win, time, replay, size, bombs)
+        VALUES(?, ?, ?, ?, ?, ?, ?)''', rows)
+        con.commit()
+
+    def run(self):
+        con = None
+        players = {}
+        stop = False
+        while not stop:
+            batch = [self.queue.get()]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            games = [result for result in batch if result is not None]
+            stop = len(games) < len(batch)
+            try:
+                for attempt in range(WRITE_ATTEMPTS if games else 0):
+                    try:
+                        if con is None:
+                            con = connect(self.path)
+                        with self.timings.measure("db_write"):
+                            self.write(con, players, games)
+                        break
+                    except sqlite3.Error as error:
+                        if con is not None:
+                            con.rollback()
+                        # Players added by rolled back transaction do not exist
+                        players.clear()
+                        if attempt + 1 < WRITE_ATTEMPTS:
+                            sleep(WRITE_RETRY_DELAY)
+                        else:
+                            print('Results of ' + str(len(games)) + ' games are not written: ' + str(error),
+                                  file=sys.stderr)
+            finally:
+                for result in batch:
+                    self.queue.task_done()
+        if con is not None:
+            con.close()
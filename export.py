@@ -0,0 +1,65 @@
+# -*- coding: utf8 -*-
+'''Export of games to Excel or CSV file, rows are read from database cursor by batches,
+so memory does not depend on amount of games'''
+import csv
+from database import RESULT_NAMES, level_name
+
+# Rows read from cursor at once
+EXPORT_BATCH = 10000
+HEADER = ('Имя', 'Уровень', 'Результат', 'Время')
+
+
+def batches(cursor):
+    '''Yields lists of rows from cursor'''
+    while True:
+        rows = cursor.fetchmany(EXPORT_BATCH)
+        if not rows:
+            return
+        yield rows
+
+
+def export_xlsx(cursor, path, progress=None):
+    '''Writes games (name, level, win, time, size, bombs) from cursor to Excel file path
+    progress(rows) is called after every batch, returns amount of rows'''
+    # xlsxwriter is imported only for export, it is not needed to start game
+    import xlsxwriter
+    wb = xlsxwriter.Workbook(path, {'constant_memory': True})
+    sh = wb.add_worksheet()
+    for i, title in enumerate(HEADER):
+        sh.write(0, i + 1, title)
+    i = 0
+    for rows in batches(cursor):
+        for name, level, win, time, size, bombs in rows:
+            i += 1
+            sh.write_number(i, 0, i)
+            sh.write_string(i, 1, name)
+            sh.write_string(i, 2, level_name(level, size, bombs))
+            sh.write_string(i, 3, RESULT_NAMES[win])
+            sh.write_number(i, 4, time)
+        if progress is not None:
+            progress(i)
+    try:
+        wb.close()
+    except xlsxwriter.exceptions.FileCreateError as error:
+        # File is opened in other program or directory is not writable
+        raise OSError(str(error)) from error
+    return i
+
+
+def export_csv(cursor, path, progress=None):
+    '''Writes games (name, level, win, time, size, bombs) from cursor to CSV file path
+    progress(rows) is called after every batch, returns amount of rows'''
+    i = 0
+    with open(path, 'w', newline='', encoding='utf-8-sig') as file:
+        writer = csv.writer(file)
+        writer.writerow(('',) + HEADER)
+        for rows in batches(cursor):
+            writer.writerows((i + j + 1, name, level_name(level, size, bombs), RESULT_NAMES[win], time)
+                             for j, (name, level, win, time, size, bombs) in enumerate(rows))
+            i += len(rows)
+            if progress is not None:
+                progress(i)
+    return i
+
+
+EXPORTS = {'xlsx': export_xlsx, 'csv': export_csv}
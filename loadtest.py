@@ -0,0 +1,181 @@
+# -*- coding: utf8 -*-
+'''Load test of server.py: plays many simultaneous games over few connections
+with a strategy of simulate.py, spectators may watch some of games
+
+Every game is seen by strategy through pole without bombs, which is filled by cells
+received from server, so strategies work the same way as in simulate.py
+
+Example: python loadtest.py --games 2000 --connections 50 --level Easy --spectators 100'''
+import argparse
+import asyncio
+import json
+import sys
+from collections import deque
+from random import Random
+from time import perf_counter
+from pole import Pole, LEVELS, OPEN, FLAG, QUESTION
+from simulate import STRATEGIES, parse_level
+from timings import Timings
+from server import MAX_CELLS
+
+# Limit of length of line read from server: one move may open all cells of the largest pole,
+# message lists them as [x, y, value], default limit of asyncio streams is 64 KiB only
+MAX_MESSAGE = MAX_CELLS * len('[999,999,0],') * 2
+
+
+class Connection:
+    '''Connection to server shared by several games, messages are routed by number of game'''
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        # Number of game -> queue of its messages
+        self.queues = {}
+        # Futures of answers to "new" in order of requests, server answers in the same order
+        self.waiting = deque()
+        self.task = asyncio.ensure_future(self.read())
+
+    @classmethod
+    async def open(cls, host, port):
+        reader, writer = await asyncio.open_connection(host, port, limit=MAX_MESSAGE)
+        return cls(reader, writer)
+
+    async def read(self):
+        '''Routes messages from server to games, ends when server closes connection'''
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                return
+            message = json.loads(line)
+            if message["type"] == "error":
+                raise RuntimeError('Server error: ' + message["message"])
+            if message["game"] not in self.queues:
+                self.queues[message["game"]] = asyncio.Queue()
+                self.waiting.popleft().set_result(message)
+            else:
+                self.queues[message["game"]].put_nowait(message)
+
+    async def send(self, message):
+        self.writer.write((json.dumps(message) + '\n').encode())
+        await self.writer.drain()
+
+    async def new_game(self, message):
+        '''Sends message "new", returns answer to it'''
+        future = asyncio.get_running_loop().create_future()
+        self.waiting.append(future)
+        await self.send(message)
+        return await future
+
+    async def request(self, message, game):
+        '''Sends message, returns the next message of game'''
+        self.queues.setdefault(game, asyncio.Queue())
+        await self.send(message)
+        return await self.queues[game].get()
+
+    async def close(self):
+        self.writer.close()
+        self.task.cancel()
+
+
+def apply_cells(pole, cells):
+    '''Puts cells [x, y, value] received from server to pole of player'''
+    for x, y, value in cells:
+        k = pole.index(x, y)
+        if isinstance(value, int):
+            if not pole.state[k] & OPEN:
+                pole.closed_safe -= 1
+            pole.state[k] = OPEN
+            pole.bombs_near[k] = value
+        else:
+            pole.state[k] = {"F": FLAG, "?": QUESTION, "#": 0}[value]
+
+
+async def play(connection, spectator, name, level, strategy, seed, timings):
+    '''Plays one game, returns (win, amount of moves)'''
+    game = await connection.new_game({"type": "new", "name": name, "level": [level[1], level[2]]
+                                     if level[0] == "Custom" else level[0], "seed": seed})
+    number = game["game"]
+    if spectator is not None:
+        await spectator.request({"type": "watch", "game": number}, number)
+    # Pole without bombs: strategy sees only cells opened by server
+    pole = Pole(level, first_click="safe")
+    player = STRATEGIES[strategy](pole, Random(seed))
+    moves = 0
+    while True:
+        x, y = player.choose()
+        moves += 1
+        start = perf_counter()
+        message = await connection.request({"type": "open", "game": number, "x": x, "y": y}, number)
+        timings.add("move", perf_counter() - start)
+        apply_cells(pole, message["cells"])
+        if "result" in message:
+            del connection.queues[number]
+            if spectator is not None:
+                # Spectator gets the same messages as player, the last of them ends game
+                while "result" not in (await spectator.queues[number].get()):
+                    pass
+                del spectator.queues[number]
+            return message["result"]["win"], moves
+        player.update([(x1, y1) for x1, y1, value in message["cells"]])
+
+
+async def run(args):
+    timings = Timings()
+    connections = [await Connection.open(args.host, args.port) for i in range(args.connections)]
+    spectators = [await Connection.open(args.host, args.port) for i in range(min(args.spectators, args.games))]
+    wins = 0
+    moves = 0
+
+    async def slot(i):
+        nonlocal wins, moves
+        connection = connections[i % len(connections)]
+        spectator = spectators[i] if i < len(spectators) else None
+        for j in range(args.rounds):
+            seed = args.seed + i * args.rounds + j
+            win, amount = await play(connection, spectator, 'bot' + str(i), args.level,
+                                     args.strategy, seed, timings)
+            wins += win
+            moves += amount
+
+    start = perf_counter()
+    games = asyncio.ensure_future(asyncio.gather(*(slot(i) for i in range(args.games))))
+    readers = [connection.task for connection in connections + spectators]
+    await asyncio.wait([games] + readers, return_when=asyncio.FIRST_COMPLETED)
+    if not games.done():
+        # Error from server or closed connection, games would wait for answers forever
+        games.cancel()
+        for task in readers:
+            if task.done():
+                task.result()
+        raise RuntimeError('Server closed connection')
+    games.result()
+    elapsed = perf_counter() - start
+    for connection in connections + spectators:
+        await connection.close()
+    games = args.games * args.rounds
+    print('Games: ' + str(games) + ', wins: ' + str(wins) + ', moves: ' + str(moves) +
+          ', time: ' + format(elapsed, '.2f') + ' s, moves per second: ' + format(moves / elapsed, '.0f'),
+          file=sys.stderr)
+    print('\n'.join(['stage: count × mean / p50 / p95 / max'] + timings.summary()), file=sys.stderr)
+    if args.timings:
+        timings.dump(args.timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test of Minesweeper game server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--games', type=int, default=1000, help='amount of simultaneous games')
+    parser.add_argument('--rounds', type=int, default=1, help='games played one after another in every slot')
+    parser.add_argument('--connections', type=int, default=10, help='connections of players, games are shared by them')
+    parser.add_argument('--spectators', type=int, default=0, help='connections of spectators, each watches one game')
+    parser.add_argument('--level', type=parse_level, default=LEVELS[0],
+                        help='Easy, Medium, Hard or "size,bombs"')
+    parser.add_argument('--strategy', choices=sorted(STRATEGIES), default='simple')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game, next games use next seeds')
+    parser.add_argument('--timings', help='JSON file for histogram of times of answers to moves')
+    args = parser.parse_args(argv)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
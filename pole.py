@@ -0,0 +1,309 @@
+# -*- coding: utf8 -*-
+'''Game logic of Minesweeper without GUI'''
+from array import array
+from random import Random
+from collections import deque
+
+# numpy is imported by get_numpy() on the first pole with at least NUMPY_MIN_CELLS cells,
+# as import of numpy takes longer than counting bombs near cells of small poles
+numpy = None
+numpy_checked = False
+NUMPY_MIN_CELLS = 32 * 32
+
+
+LEVELS = [("Easy", 8, 10), ("Medium", 16, 40), ("Hard", 24, 99)]
+INFOS = ("Flag", "Bomb", "Open", "Close", "Question")
+# Constraints for the first move: None, first cell is safe, first cell has no bombs near
+FIRST_CLICKS = (None, "safe", "zero")
+
+
+# Bit flags of cell state in Pole.state
+BOMB = 1
+OPEN = 2
+FLAG = 4
+QUESTION = 8
+# Table for bytes.translate which adds bomb to every cell
+WITH_BOMB = bytes(state | BOMB for state in range(256))
+# Sampled cells are kept in dict while they are less than this part of pole, else in array
+SPARSE_PART = 16
+
+
+def get_numpy():
+    '''Returns numpy module or None if numpy is not installed, imports it only on the first call'''
+    global numpy, numpy_checked
+    if not numpy_checked:
+        numpy_checked = True
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        numpy = module
+    return numpy
+
+
+class Pole:
+    def __init__(self, level, seed=None, first_click=None, mines=None):
+        self.level_name = level[0]
+        self.size = level[1]
+        self.bombs_amount = level[2]
+        if not 0 <= self.bombs_amount <= self.size * self.size:
+            raise ValueError("Too many bombs for pole " + str(self.size) + "x" + str(self.size))
+        if first_click not in FIRST_CLICKS:
+            raise ValueError("Unknown first click constraint: " + str(first_click))
+        if (mines is not None) and (len(mines) != self.bombs_amount):
+            raise ValueError("Amount of given bombs is not " + str(self.bombs_amount))
+        self.first_click = first_click
+        # Indexes of cells with bombs if layout is given, else bombs are random
+        self.mines = mines
+        self.random = Random(seed)
+        self.state = bytearray()
+        self.bombs_near = bytearray()
+        self.generated = False
+        self.closed_safe = 0
+        self.flags_amount = 0
+        self.generate_pole()
+    
+    def index(self, x, y):
+        '''Returns index of cell(x, y) in flat arrays of pole'''
+        return x * self.size + y
+    
+    def in_pole(self, x, y):
+        '''Returns bool value: True if cell(x, y) is in pole else: False'''
+        return (0 <= x < self.size) and (0 <= y < self.size)
+    
+    def neighbours(self, k):
+        '''Returns list of indexes of cells near cell with index k'''
+        size = self.size
+        x, y = divmod(k, size)
+        return [x1 * size + y1
+                for x1 in range(max(x - 1, 0), min(x + 2, size))
+                for y1 in range(max(y - 1, 0), min(y + 2, size))
+                if (x1 != x) or (y1 != y)]
+    
+    def generate_pole(self):
+        '''Generates pole with bombs
+        If there is a first click constraint bombs are placed on the first move'''
+        self.state = bytearray(self.size * self.size)
+        self.bombs_near = bytearray(self.size * self.size)
+        self.generated = False
+        # Running counters, so that win check and flags amount are O(1)
+        self.closed_safe = self.size * self.size - self.bombs_amount
+        self.flags_amount = 0
+        if (self.first_click is None) or (self.mines is not None):
+            self.place_bombs()
+    
+    def place_bombs(self, x=None, y=None):
+        '''Places bombs on pole, keeping free cells required by first click in cell(x, y)'''
+        state = self.state
+        excluded = set() if self.mines is not None else self.first_click_cells(x, y)
+        free = len(state) - len(excluded) - self.bombs_amount
+        if self.mines is not None:
+            for k in self.mines:
+                state[k] |= BOMB
+        elif self.bombs_amount <= free:
+            for k in self.sample_cells(excluded, self.bombs_amount):
+                state[k] |= BOMB
+        else:
+            # Dense pole: free cells are sampled and all other cells get bombs,
+            # so time and memory depend on the smaller of two amounts
+            state[:] = state.translate(WITH_BOMB)
+            for k in excluded:
+                state[k] &= ~BOMB
+            for k in self.sample_cells(excluded, free):
+                state[k] &= ~BOMB
+        self.generated = True
+        self.set_bombs_near()
+    
+    def first_click_cells(self, x, y):
+        '''Returns set of indexes of cells which must be free of bombs after first click in cell(x, y)'''
+        if (x is None) or (self.first_click is None):
+            return set()
+        free = self.size * self.size - self.bombs_amount
+        k = self.index(x, y)
+        if self.first_click == "zero":
+            # Cells in corners and on edges have less than 8 neighbours
+            cells = set(self.neighbours(k))
+            cells.add(k)
+            if len(cells) <= free:
+                return cells
+        if free >= 1:
+            return {k}
+        return set()
+    
+    def sample_cells(self, excluded, amount):
+        '''Returns list of amount different indexes of cells not in excluded
+        Uses partial Fisher-Yates shuffle in O(amount) time, array is virtual (dict of swapped
+        positions) if amount is small part of pole, else real array of 4 bytes per cell'''
+        n = self.size * self.size
+        last = n - len(excluded)
+        # Excluded cells in the sampled range are swapped with allowed cells from the tail
+        tail = [k for k in range(last, n) if k not in excluded]
+        if amount * SPARSE_PART < last:
+            swapped = {}
+            for k in excluded:
+                if k < last:
+                    swapped[k] = tail.pop()
+            cells = []
+            for i in range(amount):
+                j = self.random.randrange(i, last)
+                cells.append(swapped.get(j, j))
+                swapped[j] = swapped.get(i, i)
+            return cells
+        cells = array('i', range(last))
+        for k in excluded:
+            if k < last:
+                cells[k] = tail.pop()
+        for i in range(amount):
+            j = self.random.randrange(i, last)
+            cells[i], cells[j] = cells[j], cells[i]
+        return cells[:amount]
+    
+    def set_bombs_near(self):
+        '''Sets amount of bombs near all cells of pole
+        Uses numpy shifted sums for large poles if numpy is installed, else pure Python version'''
+        size = self.size
+        if (size * size < NUMPY_MIN_CELLS) or (get_numpy() is None):
+            self.set_bombs_near_python()
+            return
+        mines = numpy.frombuffer(self.state, dtype=numpy.uint8).reshape(size, size) & BOMB
+        padded = numpy.zeros((size + 2, size + 2), dtype=numpy.uint8)
+        padded[1:-1, 1:-1] = mines
+        near = numpy.zeros((size, size), dtype=numpy.uint8)
+        for i in range(3):
+            for j in range(3):
+                near += padded[i:i + size, j:j + size]
+        near -= mines
+        self.bombs_near = bytearray(near.tobytes())
+    
+    def set_bombs_near_python(self):
+        '''Sets amount of bombs near all cells of pole without numpy (reference version)'''
+        size = self.size
+        state = self.state
+        self.bombs_near = bytearray(size * size)
+        for i in range(size):
+            for j in range(size):
+                bombs_amount = 0
+                for x in range(max(i - 1, 0), min(i + 2, size)):
+                    for y in range(max(j - 1, 0), min(j + 2, size)):
+                        if ((x != i) or (y != j)) and (state[x * size + y] & BOMB):
+                            bombs_amount += 1
+                self.bombs_near[i * size + j] = bombs_amount
+    
+    def move(self, x, y):
+        '''Imitates game move in cell(x, y)
+        Returns None if cell is not in pole, False if player is lost,
+        else list of cells (x, y) opened by this move'''
+        if not self.in_pole(x, y):
+            return None
+        if not self.generated:
+            self.place_bombs(x, y)
+        if self.state[self.index(x, y)] & BOMB:
+            return False
+        return self.open_cells(x, y)
+        
+    def open_cells(self, x, y):
+        '''Opens all cells for player near cell(x, y) if cell(x, y) has no bombs near itself
+        Returns list of opened cells (x, y)'''
+        size = self.size
+        state = self.state
+        bombs_near = self.bombs_near
+        k = self.index(x, y)
+        if state[k] & OPEN:
+            return []
+        if state[k] & FLAG:
+            self.flags_amount -= 1
+        # OPEN bit is set when cell is queued, so it is also the visited bitmap
+        state[k] = (state[k] & BOMB) | OPEN
+        opened = [(x, y)]
+        queue = deque(opened)
+        while queue:
+            x, y = queue.popleft()
+            if bombs_near[x * size + y] != 0:
+                continue
+            for x1 in range(max(x - 1, 0), min(x + 2, size)):
+                for y1 in range(max(y - 1, 0), min(y + 2, size)):
+                    k = x1 * size + y1
+                    if not state[k] & OPEN:
+                        if state[k] & FLAG:
+                            self.flags_amount -= 1
+                        state[k] = OPEN
+                        opened.append((x1, y1))
+                        queue.append((x1, y1))
+        self.closed_safe -= len(opened)
+        return opened
+    
+    def get_pole(self):
+        '''Returns flat bytearray of states of cells : game pole'''
+        return self.state
+    
+    def get_info_cell(self, x, y):
+        '''Returns None if cell(x, y) not in pole, else returns info about cell(x, y)'''
+        if not self.in_pole(x, y):
+            return None
+        state = self.state[self.index(x, y)]
+        info = ["Open" if state & OPEN else "Close"]
+        if state & BOMB:
+            info.append("Bomb")
+        if state & FLAG:
+            info.append("Flag")
+        if state & QUESTION:
+            info.append("Question")
+        return info
+    
+    def set_info_cell(self, x, y, info):
+        '''Returns None if cell(x, y) not in pole, else sets info for cell(x, y)'''
+        if not self.in_pole(x, y):
+            return None
+        state = 0
+        for name, flag in (("Bomb", BOMB), ("Open", OPEN), ("Flag", FLAG), ("Question", QUESTION)):
+            if name in info:
+                state |= flag
+        self.set_state(self.index(x, y), state)
+    
+    def set_state(self, k, state):
+        '''Sets state of cell with index k, keeping counters of pole up to date'''
+        old = self.state[k]
+        self.flags_amount += bool(state & FLAG) - bool(old & FLAG)
+        if not (old | state) & BOMB:
+            self.closed_safe -= bool(state & OPEN) - bool(old & OPEN)
+        self.state[k] = state
+    
+    def toggle_mark(self, x, y):
+        '''Changes mark of closed cell(x, y): no mark -> Flag -> Question -> no mark
+        If there are no flags left, no mark -> Question
+        Returns None if cell(x, y) not in pole or opened, else new info about cell(x, y)'''
+        if not self.in_pole(x, y):
+            return None
+        k = self.index(x, y)
+        state = self.state[k]
+        if state & OPEN:
+            return None
+        if state & FLAG:
+            state = (state & ~FLAG) | QUESTION
+        elif state & QUESTION:
+            state &= ~QUESTION
+        elif self.get_bombs_last() > 0:
+            state |= FLAG
+        else:
+            state |= QUESTION
+        self.set_state(k, state)
+        return self.get_info_cell(x, y)
+    
+    def get_bombs_last(self):
+        '''Returns amount of bombs without flags on them'''
+        return self.bombs_amount - self.flags_amount
+    
+    def get_mines(self):
+        '''Returns list of indexes of cells with bombs'''
+        return [k for k, state in enumerate(self.state) if state & BOMB]
+    
+    def get_bombs_near_cell(self, x, y):
+        '''Returns None if cell(x, y) not in pole, else returns amount of bombs near cell(x, y)'''
+        if not self.in_pole(x, y):
+            return None
+        return self.bombs_near[self.index(x, y)]
+    
+    def check_win(self):
+        '''Checks win
+        Return True if player wins, else False'''
+        return self.closed_safe == 0
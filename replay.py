@@ -0,0 +1,169 @@
+# -*- coding: utf8 -*-
+'''Replays of games: compact binary record of mines and moves of game and
+reconstruction of pole at any move without GUI
+
+Format: magic, then unsigned LEB128 varints: size, bombs, amount of mines,
+indexes of mines as differences between neighbours in sorted order, then moves to the end
+of file, every move is time since previous move in milliseconds and index of cell * 2 + kind
+
+Example: python replay.py replays/1700000000000_1a2b3c.msr --move 10'''
+import argparse
+import os
+from time import perf_counter, time
+from random import getrandbits
+from pole import Pole
+
+MAGIC = b'MSR1'
+# Kinds of moves
+OPEN_MOVE = 0
+MARK_MOVE = 1
+REPLAYS_DIR = 'replays'
+
+
+def write_varint(out, n):
+    '''Appends unsigned number n to bytearray out'''
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def read_varint(data, i):
+    '''Returns (number, index after it) for varint at index i of data'''
+    n = 0
+    shift = 0
+    while True:
+        byte = data[i]
+        i += 1
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return n, i
+        shift += 7
+
+
+class Replay:
+    def __init__(self, size, bombs, mines=(), moves=()):
+        self.size = size
+        self.bombs = bombs
+        self.mines = list(mines)
+        # List of (milliseconds since previous move, kind, x, y)
+        self.moves = list(moves)
+        self.last = None
+
+    def start(self):
+        '''Starts clock of game, so delay of the first move is time since now'''
+        self.last = perf_counter()
+
+    def record(self, kind, x, y):
+        '''Adds move of kind in cell(x, y) made now, delay of the first move is 0 if clock
+        was not started'''
+        now = perf_counter()
+        delay = 0 if self.last is None else round((now - self.last) * 1000)
+        self.last = now
+        self.moves.append((delay, kind, x, y))
+
+    def to_bytes(self):
+        '''Returns replay encoded in binary format'''
+        out = bytearray(MAGIC)
+        write_varint(out, self.size)
+        write_varint(out, self.bombs)
+        write_varint(out, len(self.mines))
+        previous = 0
+        for k in sorted(self.mines):
+            write_varint(out, k - previous)
+            previous = k
+        for delay, kind, x, y in self.moves:
+            write_varint(out, delay)
+            write_varint(out, (x * self.size + y) * 2 + kind)
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        '''Returns replay decoded from binary format'''
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError('Not a replay of Minesweeper')
+        i = len(MAGIC)
+        size, i = read_varint(data, i)
+        bombs, i = read_varint(data, i)
+        amount, i = read_varint(data, i)
+        mines = []
+        k = 0
+        for j in range(amount):
+            delta, i = read_varint(data, i)
+            k += delta
+            mines.append(k)
+        moves = []
+        while i < len(data):
+            delay, i = read_varint(data, i)
+            code, i = read_varint(data, i)
+            x, y = divmod(code // 2, size)
+            moves.append((delay, code % 2, x, y))
+        return cls(size, bombs, mines, moves)
+
+    def save(self, directory):
+        '''Writes replay to new file in directory, returns name of file'''
+        os.makedirs(directory, exist_ok=True)
+        name = str(round(time() * 1000)) + '_' + format(getrandbits(24), '06x') + '.msr'
+        with open(os.path.join(directory, name), 'wb') as file:
+            file.write(self.to_bytes())
+        return name
+
+    @classmethod
+    def load(cls, path):
+        '''Returns replay from file path'''
+        with open(path, 'rb') as file:
+            return cls.from_bytes(file.read())
+
+    def pole(self, moves=None):
+        '''Returns pole after first moves of replay, after all moves if moves is None'''
+        pole = Pole(("Replay", self.size, self.bombs), mines=self.mines)
+        for delay, kind, x, y in self.moves[:moves]:
+            if kind == OPEN_MOVE:
+                pole.move(x, y)
+            else:
+                pole.toggle_mark(x, y)
+        return pole
+
+    def duration(self):
+        '''Returns time from the first move to the last one in seconds'''
+        return sum(move[0] for move in self.moves) / 1000
+
+
+def replays_dir(db_path):
+    '''Returns directory of replays of database db_path'''
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), REPLAYS_DIR)
+
+
+def pole_text(pole):
+    '''Returns pole as text: # closed, F flag, ? question, digits for opened cells'''
+    lines = []
+    for y in range(pole.size):
+        line = ''
+        for x in range(pole.size):
+            info = pole.get_info_cell(x, y)
+            if "Open" in info:
+                line += str(pole.get_bombs_near_cell(x, y))
+            elif "Flag" in info:
+                line += 'F'
+            elif "Question" in info:
+                line += '?'
+            else:
+                line += '#'
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Shows pole of replay of Minesweeper')
+    parser.add_argument('path')
+    parser.add_argument('--move', type=int, default=None, help='amount of moves to replay, all by default')
+    args = parser.parse_args(argv)
+    replay = Replay.load(args.path)
+    pole = replay.pole(args.move)
+    print('Pole ' + str(replay.size) + 'x' + str(replay.size) + ', bombs: ' + str(replay.bombs) +
+          ', moves: ' + str(len(replay.moves)) + ', time: ' + str(replay.duration()) + ' s')
+    print(pole_text(pole))
+
+
+if __name__ == '__main__':
+    main()
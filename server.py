@@ -0,0 +1,279 @@
+# -*- coding: utf8 -*-
+'''Game server: hosts many games on one asyncio loop, players and spectators
+are connected by TCP, results are written to games.db like in Minesweeper.py
+
+Protocol: every message is one line of JSON
+Client -> server:
+    {"type": "new", "name": "Player", "level": "Easy" or [size, bombs], "seed": 1 (not necessary)}
+    {"type": "open", "game": 1, "x": 0, "y": 0}
+    {"type": "mark", "game": 1, "x": 0, "y": 0}
+    {"type": "watch", "game": 1}
+Server -> client:
+    {"type": "game", "game": 1, "size": 8, "bombs": 10, "cells": [[x, y, value], ...]}
+        answer to "new" and "watch", cells are all opened and marked cells
+    {"type": "cells", "game": 1, "cells": [[x, y, value], ...], "result": {...}}
+        answer to every move, sent to player and spectators, cells are only cells changed by move,
+        value is amount of bombs near opened cell, "F" for flag, "?" for question, "#" for closed cell
+        result is only in message of the last move: {"win": true, "time": 12, "mines": [[x, y], ...]}
+    {"type": "error", "message": "..."}
+
+Example: python server.py --port 8765'''
+import argparse
+import asyncio
+import json
+import signal
+import sys
+from time import perf_counter
+from pole import Pole, LEVELS, OPEN, FLAG, QUESTION
+from database import ResultWriter, CUSTOM_LEVEL
+from replay import Replay, OPEN_MOVE, MARK_MOVE, replays_dir
+
+# Custom poles with more cells are not created
+MAX_CELLS = 1000 * 1000
+# Moves of poles with so many cells are made in thread of executor, one move may open all cells
+EXECUTOR_MIN_CELLS = 64 * 64
+# Spectator is disconnected if so many bytes are not sent to it yet
+MAX_SPECTATOR_BUFFER = 1 << 20
+
+
+def cell_value(pole, x, y):
+    '''Returns value of cell(x, y) visible to player: amount of bombs near opened cell,
+    "F" for flag, "?" for question, "#" for closed cell'''
+    k = pole.index(x, y)
+    state = pole.state[k]
+    if state & OPEN:
+        return pole.bombs_near[k]
+    if state & FLAG:
+        return "F"
+    if state & QUESTION:
+        return "?"
+    return "#"
+
+
+def encode(message):
+    '''Returns message as line of JSON in bytes'''
+    return (json.dumps(message, separators=(',', ':')) + '\n').encode()
+
+
+def parse_level(value):
+    '''Returns (number of level, level tuple) from name of level or list [size, bombs]'''
+    if isinstance(value, str):
+        for i, level in enumerate(LEVELS):
+            if level[0].lower() == value.lower():
+                return i + 1, level
+        raise ValueError('Unknown level: ' + value)
+    size, bombs = int(value[0]), int(value[1])
+    if size <= 0 or size * size > MAX_CELLS:
+        raise ValueError('Pole must have from 1 to ' + str(MAX_CELLS) + ' cells')
+    return CUSTOM_LEVEL, ("Custom", size, bombs)
+
+
+class Session:
+    '''One game: pole, player and spectators'''
+    def __init__(self, number, name, level_number, level, player, seed=None):
+        self.number = number
+        self.name = name
+        self.level_number = level_number
+        self.pole = Pole(level, seed=seed, first_click="safe")
+        self.player = player
+        self.spectators = set()
+        self.replay = Replay(level[1], level[2])
+        self.replay.start()
+        self.start = None
+        self.time = None
+        # Moves and snapshots of one game are not made at the same time in different threads
+        self.lock = asyncio.Lock()
+
+    def snapshot(self, new=False):
+        '''Returns message "game" with all opened and marked cells, new game has no such cells'''
+        pole = self.pole
+        size = pole.size
+        cells = []
+        if not new:
+            cells = [[k // size, k % size, cell_value(pole, k // size, k % size)]
+                     for k, state in enumerate(pole.state) if state & (OPEN | FLAG | QUESTION)]
+        return {"type": "game", "game": self.number, "size": size, "bombs": pole.bombs_amount,
+                "cells": cells}
+
+    def move(self, kind, x, y):
+        '''Makes move of kind in cell(x, y)
+        Returns (list of changed cells [x, y, value], win: None if game is not ended, else bool)'''
+        pole = self.pole
+        if not pole.in_pole(x, y):
+            raise ValueError('Cell is not in pole')
+        if self.start is None:
+            self.start = perf_counter()
+        if kind == MARK_MOVE:
+            if pole.toggle_mark(x, y) is None:
+                return [], None
+            self.replay.record(MARK_MOVE, x, y)
+            return [[x, y, cell_value(pole, x, y)]], None
+        if pole.state[pole.index(x, y)] & (OPEN | FLAG | QUESTION):
+            return [], None
+        self.replay.record(OPEN_MOVE, x, y)
+        opened = pole.move(x, y)
+        if opened is False:
+            return [], False
+        cells = [[x1, y1, pole.bombs_near[pole.index(x1, y1)]] for x1, y1 in opened]
+        return cells, (True if pole.check_win() else None)
+
+    def result(self, win):
+        '''Ends game, returns result part of message of the last move'''
+        size = self.pole.size
+        self.time = round(perf_counter() - self.start)
+        return {"win": win, "time": self.time,
+                "mines": [list(divmod(k, size)) for k in self.pole.get_mines()]}
+
+    def play(self, kind, x, y):
+        '''Makes move like move(), returns (win, message "cells" of move encoded by encode)'''
+        cells, win = self.move(kind, x, y)
+        reply = {"type": "cells", "game": self.number, "cells": cells}
+        if win is not None:
+            reply["result"] = self.result(win)
+        return win, encode(reply)
+
+    def save_replay(self, directory):
+        '''Writes replay of ended game to directory, returns name of its file'''
+        self.replay.mines = self.pole.get_mines()
+        return self.replay.save(directory)
+
+
+class Server:
+    def __init__(self, db_path='games.db', save_replays=True):
+        self.results = ResultWriter(db_path)
+        self.replays = replays_dir(db_path) if save_replays else None
+        self.sessions = {}
+        self.last_number = 0
+
+    def send(self, writer, message):
+        writer.write(encode(message))
+
+    def broadcast(self, session, data):
+        '''Sends message encoded to data to player and spectators of session,
+        slow spectators are disconnected'''
+        session.player.write(data)
+        for writer in list(session.spectators):
+            if writer.transport.get_write_buffer_size() > MAX_SPECTATOR_BUFFER:
+                session.spectators.discard(writer)
+                writer.close()
+                continue
+            writer.write(data)
+
+    async def run(self, session, function, *args):
+        '''Returns function(*args) which uses pole of session, for large poles it is called
+        in thread of executor, so that other games are not stopped'''
+        async with session.lock:
+            if session.pole.size * session.pole.size < EXECUTOR_MIN_CELLS:
+                return function(*args)
+            return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    async def finish(self, session, win):
+        '''Removes ended session and adds its result to database'''
+        del self.sessions[session.number]
+        replay = None
+        if self.replays is not None:
+            # Writing of file must not stop other games
+            try:
+                replay = await asyncio.get_running_loop().run_in_executor(None, session.save_replay,
+                                                                          self.replays)
+            except OSError as error:
+                # Result of game is written without replay
+                print('Replay of game ' + str(session.number) + ' is not saved: ' + str(error),
+                      file=sys.stderr)
+        self.results.add(session.name, session.level_number, int(win), session.time, replay,
+                         session.pole.size, session.pole.bombs_amount)
+
+    async def handle(self, message, writer, owned):
+        '''Processes message of client with writer, owned is set of numbers of its games'''
+        kind = message.get("type")
+        if kind == "new":
+            level_number, level = parse_level(message.get("level", LEVELS[0][0]))
+            self.last_number += 1
+            session = Session(self.last_number, str(message.get("name", '')), level_number, level,
+                              writer, message.get("seed"))
+            self.sessions[session.number] = session
+            owned.add(session.number)
+            self.send(writer, session.snapshot(True))
+            return
+        session = self.sessions.get(message.get("game"))
+        if session is None:
+            raise ValueError('No such game: ' + str(message.get("game")))
+        if kind == "watch":
+            data = await self.run(session, lambda: encode(session.snapshot()))
+            # Moves made after snapshot are sent to spectator by broadcast
+            session.spectators.add(writer)
+            writer.write(data)
+            return
+        if kind not in ("open", "mark"):
+            raise ValueError('Unknown type of message: ' + str(kind))
+        if session.number not in owned:
+            raise ValueError('Game ' + str(session.number) + ' belongs to other player')
+        win, data = await self.run(session, session.play, OPEN_MOVE if kind == "open" else MARK_MOVE,
+                                   int(message["x"]), int(message["y"]))
+        self.broadcast(session, data)
+        if win is None:
+            return
+        owned.discard(session.number)
+        await self.finish(session, win)
+
+    async def serve_client(self, reader, writer):
+        owned = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    await self.handle(json.loads(line), writer, owned)
+                except (ValueError, KeyError, TypeError, IndexError, AttributeError) as error:
+                    self.send(writer, {"type": "error", "message": str(error)})
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            # Games of disconnected player are dropped without results
+            for number in owned:
+                self.sessions.pop(number, None)
+            for session in self.sessions.values():
+                session.spectators.discard(writer)
+            writer.close()
+
+    def close(self):
+        '''Writes all results of ended games'''
+        self.results.close()
+
+
+async def serve(host, port, db_path, save_replays):
+    server = Server(db_path, save_replays)
+    listener = await asyncio.start_server(server.serve_client, host, port)
+    print('Serving on ' + ', '.join(str(s.getsockname()) for s in listener.sockets), flush=True)
+    stop = asyncio.Event()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal_number, stop.set)
+        except NotImplementedError:
+            # Windows: Ctrl+C stops asyncio.run by KeyboardInterrupt
+            pass
+    try:
+        async with listener:
+            await stop.wait()
+    finally:
+        # Results of ended games are in queue of writer thread yet
+        server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Server of Minesweeper games for players and spectators')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--db', default='games.db', help='database of players and games')
+    parser.add_argument('--no-replays', action='store_true', help='do not save replays of games')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.db, not args.no_replays))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+# -*- coding: utf8 -*-
+'''Headless batch simulator: plays many games with a strategy on all cores
+and prints result of every game as a JSON line
+
+Example: python simulate.py --games 100000 --level Hard --strategy simple'''
+import argparse
+import json
+import sys
+from collections import deque
+from multiprocessing import Pool as ProcessPool
+from random import Random
+from time import perf_counter
+from pole import Pole, LEVELS, FIRST_CLICKS, OPEN
+from solver import Solver
+
+
+class RandomStrategy:
+    '''Opens random closed cells'''
+    def __init__(self, pole, random):
+        self.pole = pole
+        self.random = random
+        self.mines = set()
+
+    def choose(self):
+        '''Returns cell (x, y) to open'''
+        pole = self.pole
+        n = pole.size * pole.size
+        for i in range(100):
+            k = self.random.randrange(n)
+            if not (pole.state[k] & OPEN) and (k not in self.mines):
+                return divmod(k, pole.size)
+        # Almost all pole is opened, so choose from the rest
+        closed = [k for k in range(n) if not (pole.state[k] & OPEN) and (k not in self.mines)]
+        if not closed:
+            closed = [k for k in range(n) if not pole.state[k] & OPEN]
+        return divmod(self.random.choice(closed), pole.size)
+
+    def update(self, opened):
+        '''Gets list of cells (x, y) opened by last move'''
+        pass
+
+
+class SimpleStrategy(RandomStrategy):
+    '''Opens cells which are safe by rules of single opened cell, else random cells'''
+    def __init__(self, pole, random):
+        super().__init__(pole, random)
+        self.safe = []
+        # Opened cells which neighbours must be checked again
+        self.todo = deque()
+
+    def check(self, k):
+        '''Applies rules of single cell to opened cell with index k'''
+        state = self.pole.state
+        near = self.pole.bombs_near[k]
+        closed = []
+        mines = 0
+        for k1 in self.pole.neighbours(k):
+            if k1 in self.mines:
+                mines += 1
+            elif not state[k1] & OPEN:
+                closed.append(k1)
+        if not closed:
+            return
+        if near == mines:
+            self.safe.extend(closed)
+        elif near - mines == len(closed):
+            for k1 in closed:
+                self.mines.add(k1)
+                self.todo.extend(k2 for k2 in self.pole.neighbours(k1) if state[k2] & OPEN)
+
+    def choose(self):
+        '''Returns cell (x, y) to open'''
+        state = self.pole.state
+        while True:
+            while self.safe:
+                k = self.safe.pop()
+                if not state[k] & OPEN:
+                    return divmod(k, self.pole.size)
+            if not self.todo:
+                return super().choose()
+            self.check(self.todo.popleft())
+
+    def update(self, opened):
+        '''Gets list of cells (x, y) opened by last move'''
+        size = self.pole.size
+        state = self.pole.state
+        for x, y in opened:
+            k = x * size + y
+            self.todo.append(k)
+            self.todo.extend(k1 for k1 in self.pole.neighbours(k) if state[k1] & OPEN)
+
+
+class SolverStrategy:
+    '''Opens cells found by Solver: certainly safe cells, else cell with the least probability of mine'''
+    def __init__(self, pole, random):
+        self.solver = Solver(pole)
+
+    def choose(self):
+        '''Returns cell (x, y) to open'''
+        x, y, kind = self.solver.best_move()
+        return x, y
+
+    def update(self, opened):
+        '''Gets list of cells (x, y) opened by last move'''
+        self.solver.update(opened)
+
+
+STRATEGIES = {"random": RandomStrategy, "simple": SimpleStrategy, "solver": SolverStrategy}
+
+
+def play_game(level, strategy, seed, first_click="safe"):
+    '''Plays one game with strategy on pole generated from seed
+    Returns dict with result of game'''
+    start = perf_counter()
+    pole = Pole(level, seed=seed, first_click=first_click)
+    player = STRATEGIES[strategy](pole, Random(seed))
+    moves = 0
+    while True:
+        x, y = player.choose()
+        moves += 1
+        opened = pole.move(x, y)
+        if opened is False:
+            win = False
+            break
+        if pole.check_win():
+            win = True
+            break
+        player.update(opened)
+    safe = pole.size * pole.size - pole.bombs_amount
+    return {"seed": seed, "level": level[0], "size": level[1], "bombs": level[2],
+            "strategy": strategy, "win": win, "moves": moves,
+            "opened": safe - pole.closed_safe, "time": round(perf_counter() - start, 6)}
+
+
+def play_games(task):
+    '''Plays games with seeds from range, task is (level, strategy, first_click, seeds)'''
+    level, strategy, first_click, seeds = task
+    return [play_game(level, strategy, seed, first_click) for seed in seeds]
+
+
+def parse_level(text):
+    '''Returns level tuple from name of level or from string "size,bombs"'''
+    for level in LEVELS:
+        if level[0].lower() == text.lower():
+            return level
+    try:
+        size, bombs = map(int, text.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError('level must be one of ' +
+                                         ', '.join(level[0] for level in LEVELS) + ' or "size,bombs"')
+    return ("Custom", size, bombs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Plays Minesweeper games without GUI')
+    parser.add_argument('--games', type=int, default=1000, help='amount of games')
+    parser.add_argument('--level', type=parse_level, default=LEVELS[0],
+                        help='Easy, Medium, Hard or "size,bombs"')
+    parser.add_argument('--strategy', choices=sorted(STRATEGIES), default='simple')
+    parser.add_argument('--first-click', choices=[c for c in FIRST_CLICKS if c], default='safe')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game, next games use next seeds')
+    parser.add_argument('--workers', type=int, default=None, help='amount of processes, all cores by default')
+    parser.add_argument('--chunk', type=int, default=100, help='games in one task of process')
+    args = parser.parse_args(argv)
+    tasks = ((args.level, args.strategy, args.first_click,
+              range(start, min(start + args.chunk, args.seed + args.games)))
+             for start in range(args.seed, args.seed + args.games, args.chunk))
+    wins = 0
+    with ProcessPool(args.workers) as pool:
+        for results in pool.imap_unordered(play_games, tasks):
+            for result in results:
+                wins += result["win"]
+                sys.stdout.write(json.dumps(result) + '\n')
+    print('Win rate: ' + str(wins / max(args.games, 1)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
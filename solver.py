@@ -0,0 +1,292 @@
+# -*- coding: utf8 -*-
+'''Solver of Minesweeper: finds certainly safe cells, certainly mined cells and
+probabilities of mines in cells using only information visible to player'''
+from collections import deque
+from pole import OPEN, FLAG
+
+# Components of frontier with more cells are not enumerated
+MAX_ENUMERATION = 24
+
+
+class Solver:
+    def __init__(self, pole):
+        self.pole = pole
+        self.mines = set()
+        self.safe = set()
+        # Lists of cells opened by moves since last solve, they are processed by solve
+        self.opened = []
+        # Opened cells which constraints changed since last solve
+        self.dirty = set()
+        # Unknown cells of components forgotten because other their cells became known
+        self.stale = set()
+        # Results of enumeration by frontier component: cells -> (totals, counts)
+        self.components = {}
+        # Frontier cell -> cells of its component
+        self.component_of = {}
+
+    def is_unknown(self, k):
+        '''Returns bool value: True if nothing is known about cell with index k'''
+        return not (self.pole.state[k] & OPEN) and (k not in self.mines) and (k not in self.safe)
+
+    def constraint(self, k):
+        '''Returns constraint of opened cell with index k:
+        (frozenset of unknown cells near it, amount of mines among them)'''
+        cells = []
+        mines = 0
+        for k1 in self.pole.neighbours(k):
+            if k1 in self.mines:
+                mines += 1
+            elif self.is_unknown(k1):
+                cells.append(k1)
+        return frozenset(cells), self.pole.bombs_near[k] - mines
+
+    def update(self, opened):
+        '''Gets list of cells (x, y) opened by last move, they are processed by next solve'''
+        self.opened.append(opened)
+    
+    def apply_opened(self):
+        '''Adds cells opened since last solve and opened cells near them to dirty'''
+        size = self.pole.size
+        state = self.pole.state
+        for opened in self.opened:
+            for x, y in opened:
+                k = x * size + y
+                self.safe.discard(k)
+                self.dirty.add(k)
+                self.dirty.update(k1 for k1 in self.pole.neighbours(k) if state[k1] & OPEN)
+        self.opened = []
+
+    def mark(self, cells, mine):
+        '''Saves that cells are mines or safe, returns opened cells near them'''
+        state = self.pole.state
+        touched = set()
+        for k in cells:
+            if mine:
+                self.mines.add(k)
+            else:
+                self.safe.add(k)
+            # Enumeration of component of known cell is not valid for its other cells
+            self.invalidate(k, self.stale)
+            touched.update(k1 for k1 in self.pole.neighbours(k) if state[k1] & OPEN)
+        return touched
+
+    def propagate(self, queue):
+        '''Applies single cell and subset rules to constraints of opened cells in queue
+        Returns set of all checked opened cells'''
+        queue = deque(queue)
+        checked = set(queue)
+        while queue:
+            k = queue.popleft()
+            cells, need = self.constraint(k)
+            if not cells:
+                continue
+            found = None
+            if need == 0:
+                found = self.mark(cells, False)
+            elif need == len(cells):
+                found = self.mark(cells, True)
+            else:
+                # Subset rule with constraints of opened cells sharing unknown cells
+                others = {k2 for k1 in cells for k2 in self.pole.neighbours(k1)
+                          if (k2 != k) and (self.pole.state[k2] & OPEN)}
+                for k2 in others:
+                    cells2, need2 = self.constraint(k2)
+                    if not cells2 or not cells2 < cells:
+                        continue
+                    rest = cells - cells2
+                    if need == need2:
+                        found = self.mark(rest, False)
+                    elif need - need2 == len(rest):
+                        found = self.mark(rest, True)
+                    else:
+                        continue
+                    break
+            if found:
+                found.add(k)
+                checked.update(found)
+                queue.extend(found)
+        return checked
+
+    def enumerate(self, constraints):
+        '''Enumerates all arrangements of mines satisfying constraints of one component
+        Returns (totals, counts): totals[m] is amount of arrangements with m mines,
+        counts[cell][m] is amount of them with mine in cell'''
+        cells = sorted({k for c in constraints for k in c[0]})
+        position = {k: i for i, k in enumerate(cells)}
+        by_cell = [[] for k in cells]
+        for i, (group, need) in enumerate(constraints):
+            for k in group:
+                by_cell[position[k]].append(i)
+        # Mines still needed and cells still free for every constraint
+        need = [c[1] for c in constraints]
+        free = [len(c[0]) for c in constraints]
+        totals = {}
+        counts = [{} for k in cells]
+        assignment = [0] * len(cells)
+
+        def search(i, mines):
+            if i == len(cells):
+                totals[mines] = totals.get(mines, 0) + 1
+                for j in range(len(cells)):
+                    if assignment[j]:
+                        counts[j][mines] = counts[j].get(mines, 0) + 1
+                return
+            for value in (0, 1):
+                if all(0 <= need[c] - value <= free[c] - 1 for c in by_cell[i]):
+                    assignment[i] = value
+                    for c in by_cell[i]:
+                        need[c] -= value
+                        free[c] -= 1
+                    search(i + 1, mines + value)
+                    for c in by_cell[i]:
+                        need[c] += value
+                        free[c] += 1
+            assignment[i] = 0
+
+        search(0, 0)
+        return totals, dict(zip(cells, counts))
+
+    def invalidate(self, k, frontier):
+        '''Forgets component of cell with index k, its unknown cells are added to frontier'''
+        old = self.component_of.pop(k, None)
+        if old is None:
+            return
+        self.components.pop(old, None)
+        for k1 in old:
+            self.component_of.pop(k1, None)
+            if self.is_unknown(k1):
+                frontier.add(k1)
+
+    def solve_components(self, checked):
+        '''Enumerates frontier components containing constraints of checked opened cells'''
+        state = self.pole.state
+        frontier = self.stale
+        self.stale = set()
+        for k in checked:
+            self.invalidate(k, frontier)
+            if state[k] & OPEN:
+                frontier.update(self.constraint(k)[0])
+        for k in list(frontier):
+            self.invalidate(k, frontier)
+        while frontier:
+            start = frontier.pop()
+            if not self.is_unknown(start):
+                continue
+            cells = {start}
+            constraints = {}
+            queue = deque([start])
+            while queue:
+                k = queue.popleft()
+                self.invalidate(k, frontier)
+                for k1 in self.pole.neighbours(k):
+                    if (k1 in constraints) or not (state[k1] & OPEN):
+                        continue
+                    constraints[k1] = self.constraint(k1)
+                    for k2 in constraints[k1][0]:
+                        if k2 not in cells:
+                            cells.add(k2)
+                            queue.append(k2)
+            frontier -= cells
+            if len(cells) > MAX_ENUMERATION:
+                result = None
+            else:
+                result = self.enumerate(list(constraints.values()))
+            component = frozenset(cells)
+            self.components[component] = result
+            for k in cells:
+                self.component_of[k] = component
+            if result is None:
+                continue
+            totals, counts = result
+            mines = {k for k in cells if all(counts[k].get(m, 0) == t for m, t in totals.items())}
+            safe = {k for k in cells if not counts[k]}
+            if mines or safe:
+                # Certain cells leave frontier, so constraints near them are checked again
+                self.invalidate(start, set())
+                touched = self.propagate(self.mark(mines, True) | self.mark(safe, False))
+                for k in touched:
+                    frontier.update(self.constraint(k)[0])
+                frontier |= self.stale
+                self.stale = set()
+                for k in list(frontier):
+                    self.invalidate(k, frontier)
+
+    def solve(self):
+        '''Finds cells which are certainly safe or mined after last moves
+        Returns (set of safe cells (x, y), set of mined cells (x, y))'''
+        self.apply_opened()
+        if self.dirty or self.stale:
+            checked = self.propagate(self.dirty)
+            self.dirty = set()
+            self.solve_components(checked)
+        self.safe = {k for k in self.safe if not self.pole.state[k] & OPEN}
+        size = self.pole.size
+        return ({divmod(k, size) for k in self.safe}, {divmod(k, size) for k in self.mines})
+
+    def density(self):
+        '''Returns probability of mine in cell which is not near opened cells'''
+        pole = self.pole
+        unknown = pole.closed_safe + pole.bombs_amount - len(self.mines) - len(self.safe)
+        if unknown <= 0:
+            return 0
+        return (pole.bombs_amount - len(self.mines)) / unknown
+
+    def probabilities(self):
+        '''Returns dict: unknown frontier cell (x, y) -> probability of mine in it
+        Components are the same as after last solve'''
+        p = min(max(self.density(), 1e-9), 1 - 1e-9)
+        ratio = p / (1 - p)
+        size = self.pole.size
+        result = {}
+        for component, counts in self.components.items():
+            if counts is None:
+                for k in component:
+                    if self.is_unknown(k):
+                        result[divmod(k, size)] = p
+                continue
+            totals, cells = counts
+            weights = {m: ratio ** m for m in totals}
+            total = sum(weights[m] * t for m, t in totals.items())
+            for k, by_mines in cells.items():
+                if not self.is_unknown(k):
+                    continue
+                result[divmod(k, size)] = sum(weights[m] * t for m, t in by_mines.items()) / total
+        return result
+
+    def hint(self):
+        '''Returns (x, y, kind): kind is "mine" for certainly mined cell without flag,
+        else returns best_move()'''
+        safe, mines = self.solve()
+        if not safe:
+            state = self.pole.state
+            for x, y in sorted(mines):
+                if not state[self.pole.index(x, y)] & FLAG:
+                    return x, y, "mine"
+        return self.best_move()
+
+    def best_move(self):
+        '''Returns (x, y, kind): kind is "safe" for certainly safe cell,
+        else "guess" for cell with the least probability of mine'''
+        safe, mines = self.solve()
+        if safe:
+            x, y = min(safe)
+            return x, y, "safe"
+        size = self.pole.size
+        probabilities = self.probabilities()
+        best = None
+        if probabilities:
+            best = min(probabilities, key=probabilities.get)
+            if probabilities[best] <= self.density():
+                return best[0], best[1], "guess"
+        # Cell far from opened cells, corners first as they open areas more often
+        for x, y in ((0, 0), (0, size - 1), (size - 1, 0), (size - 1, size - 1)):
+            if self.is_unknown(x * size + y) and (x, y) not in probabilities:
+                return x, y, "guess"
+        interior = None
+        for k in range(size * size):
+            if self.is_unknown(k) and divmod(k, size) not in probabilities:
+                interior = divmod(k, size)
+                break
+        if interior is None:
+            interior = best
+        return interior[0], interior[1], "guess"
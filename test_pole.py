@@ -0,0 +1,20 @@
+# -*- coding: utf8 -*-
+'''Tests of Pole: numpy and pure Python counts of bombs near cells are the same'''
+import pytest
+import pole
+from pole import Pole
+
+numpy = pytest.importorskip('numpy')
+
+
+@pytest.mark.parametrize('size', [1, 2, 8, 24, 32, 57, 100])
+@pytest.mark.parametrize('density', [0, 0.1, 0.5, 0.9, 1])
+def test_bombs_near_numpy_equals_python(monkeypatch, size, density):
+    # Small poles are counted without numpy, so numpy is used for all sizes here
+    monkeypatch.setattr(pole, 'NUMPY_MIN_CELLS', 0)
+    for seed in range(3):
+        p = Pole(("Random", size, round(size * size * density)), seed=seed)
+        p.set_bombs_near()
+        fast = bytes(p.bombs_near)
+        p.set_bombs_near_python()
+        assert fast == bytes(p.bombs_near)
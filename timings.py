@@ -0,0 +1,92 @@
+# -*- coding: utf8 -*-
+'''Optional instrumentation of hot paths: histograms of durations of named stages
+(click, move, draw, generation of pole, writing to database, ...)
+
+Enabled by environment variable MINESWEEPER_TIMINGS or option --timings of Minesweeper.py,
+value is path of JSON file which histograms are written to when game is closed'''
+import json
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+
+ENVIRONMENT_VARIABLE = 'MINESWEEPER_TIMINGS'
+# Upper bounds of buckets of histograms in microseconds, the last bucket has no bound
+BUCKETS = tuple(base * 10 ** power for power in range(1, 7) for base in (1, 2, 5)) + (10 ** 7,)
+
+
+def stage_percentile(stage, part):
+    '''Returns upper bound in microseconds of bucket containing part of durations of stage,
+    but not more than maximal duration'''
+    rank = part * stage["count"]
+    seen = 0
+    for i, count in enumerate(stage["buckets"]):
+        seen += count
+        if seen >= rank and count:
+            return min(BUCKETS[i], stage["max"]) if i < len(BUCKETS) else stage["max"]
+    return stage["max"]
+
+
+class Timings:
+    '''Histograms of durations by name of stage, can be filled from several threads
+    If it is disabled, measure() costs almost nothing and nothing is recorded'''
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        # Name -> {"count", "total", "max", "buckets"}, times in microseconds
+        self.stages = {}
+
+    def add(self, name, seconds):
+        '''Records duration of stage name in seconds'''
+        if not self.enabled:
+            return
+        us = seconds * 1000000
+        with self.lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = {"count": 0, "total": 0, "max": 0,
+                                             "buckets": [0] * (len(BUCKETS) + 1)}
+            stage["count"] += 1
+            stage["total"] += us
+            stage["max"] = max(stage["max"], us)
+            stage["buckets"][bisect_left(BUCKETS, us)] += 1
+
+    def measure(self, name):
+        '''Returns context manager which records duration of its block as stage name'''
+        if not self.enabled:
+            return nullcontext()
+        return self.timer(name)
+
+    @contextmanager
+    def timer(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, perf_counter() - start)
+
+    def copy_stages(self):
+        '''Returns copy of stages, other threads may add durations while it is used'''
+        with self.lock:
+            return {name: dict(stage, buckets=list(stage["buckets"])) for name, stage in self.stages.items()}
+
+    def summary(self):
+        '''Returns list of lines: name, amount, mean, p50, p95 and maximum of durations in ms'''
+        lines = []
+        stages = self.copy_stages()
+        for name in sorted(stages):
+            stage = stages[name]
+            values = (stage["total"] / stage["count"], stage_percentile(stage, 0.5),
+                      stage_percentile(stage, 0.95), stage["max"])
+            lines.append(name + ': ' + str(stage["count"]) + ' × ' +
+                         ' / '.join(format(value / 1000, '.2f') for value in values) + ' ms')
+        return lines
+
+    def to_dict(self):
+        '''Returns histograms as dict for JSON: bounds of buckets in microseconds and stages'''
+        return {"bucket_bounds_us": list(BUCKETS), "stages": self.copy_stages()}
+
+    def dump(self, path):
+        '''Writes histograms to JSON file path'''
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=1, sort_keys=True)